@@ -0,0 +1,139 @@
+"""
+Offline benchmarks for the generation engine.
+
+Runs JsonformerClaude against MockAnthropicClient, so no API key or network is
+needed, and reports the engine's CPU time per generated byte (the mock's own
+work is subtracted), requests per object and how both scale with object width,
+nesting depth and array length, plus the prompt bytes sent per object.
+
+    python -m benchmarks.bench_generation
+    python -m benchmarks.bench_generation --mistake-rate 0.2 --chunk-size 4
+    python -m benchmarks.bench_generation --speculative
+    python -m benchmarks.bench_generation --parallel
+    python -m benchmarks.bench_generation --mistake-rate 0.2 --array-window 5
+"""
+import argparse
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from benchmarks import schemas
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+
+
+@dataclass
+class Measurement:
+    name: str
+    output_bytes: int
+    requests: int
+    mistakes: int
+    cpu_seconds: float
+    prompt_bytes: int
+
+    @property
+    def us_per_byte(self) -> float:
+        return self.cpu_seconds * 1e6 / self.output_bytes if self.output_bytes else 0.0
+
+
+def measure(
+    name: str, schema: Dict[str, Any], args: argparse.Namespace, array_length: int = 3
+) -> Measurement:
+    output_bytes = requests = mistakes = prompt_bytes = 0
+    cpu_seconds = 0.0
+
+    for seed in range(args.repeat):
+        client = MockAnthropicClient.from_schema(
+            schema,
+            array_length=array_length,
+            chunk_size=args.chunk_size,
+            mistake_rate=args.mistake_rate,
+            whitespace=args.whitespace,
+            seed=seed,
+        )
+        gen_json = JsonformerClaude(
+            anthropic_client=client,
+            json_schema=schema,
+            prompt="Benchmark",
+            speculative=args.speculative,
+            parallel=args.parallel,
+            array_window=args.array_window,
+        )
+        start = time.process_time()
+        value = asyncio.run(gen_json())
+        cpu_seconds += time.process_time() - start - client.cpu_time
+
+        if value != client.value:
+            raise AssertionError(f"{name}: generated value differs from the mock document")
+        output_bytes += len(client.document)
+        requests += gen_json.llm_request_count
+        mistakes += client.mistakes_injected
+        prompt_bytes += client.prompt_bytes
+
+    return Measurement(
+        name=name,
+        output_bytes=output_bytes // args.repeat,
+        requests=requests,
+        mistakes=mistakes,
+        cpu_seconds=cpu_seconds / args.repeat,
+        prompt_bytes=prompt_bytes // args.repeat,
+    )
+
+
+def report(title: str, measurements: List[Measurement], repeat: int):
+    print(f"\n{title}")
+    print(f"{'case':<24}{'bytes':>10}{'req/obj':>10}{'mistakes':>10}{'cpu ms':>10}{'us/byte':>10}{'prompt B':>10}")
+    for m in measurements:
+        print(
+            f"{m.name:<24}{m.output_bytes:>10}{m.requests / repeat:>10.2f}"
+            f"{m.mistakes / repeat:>10.2f}{m.cpu_seconds * 1e3:>10.2f}{m.us_per_byte:>10.2f}"
+            f"{m.prompt_bytes:>10}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chunk-size", type=int, default=8)
+    parser.add_argument("--mistake-rate", type=float, default=0.0)
+    parser.add_argument("--whitespace", action="store_true")
+    parser.add_argument("--speculative", action="store_true")
+    parser.add_argument("--parallel", action="store_true")
+    parser.add_argument("--array-window", type=int, default=None)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    report(
+        "example schemas",
+        [
+            measure("car", schemas.CAR, args),
+            measure("gatsby", schemas.GATSBY, args, array_length=20),
+            measure("enum", schemas.ENUM, args),
+            measure("union", schemas.UNION, args),
+            measure("recursion", schemas.RECURSION, args),
+        ],
+        args.repeat,
+    )
+    report(
+        "object width",
+        [measure(f"wide {n}", schemas.wide(n), args) for n in args.sizes],
+        args.repeat,
+    )
+    report(
+        "nesting depth",
+        [measure(f"deep {n}", schemas.deep(n), args) for n in args.sizes if n <= 200],
+        args.repeat,
+    )
+    report(
+        "array length",
+        [
+            measure(f"gatsby {n}", schemas.GATSBY, args, array_length=n)
+            for n in args.sizes
+        ],
+        args.repeat,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Prompt size of each schema format on the example schemas.
+
+Reports the bytes of the schema text and of the whole first prompt per format,
+and the bytes sent over a generation with re-requests, against the mock client.
+
+    python -m benchmarks.bench_prompt
+    python -m benchmarks.bench_prompt --mistake-rate 0.3
+"""
+import argparse
+import asyncio
+
+from benchmarks import schemas
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+from jsonformer_claude.render import SCHEMA_FORMATS, render_schema
+from jsonformer_claude.schema import compile_schema
+
+EXAMPLES = {
+    "car": schemas.CAR,
+    "gatsby": schemas.GATSBY,
+    "enum": schemas.ENUM,
+    "union": schemas.UNION,
+    "recursion": schemas.RECURSION,
+}
+
+
+def prompt_bytes(schema: dict, schema_format: str, args: argparse.Namespace) -> float:
+    """Average prompt bytes sent per generation, re-requests included."""
+    sent = 0
+    for seed in range(args.repeat):
+        client = MockAnthropicClient.from_schema(
+            schema, mistake_rate=args.mistake_rate, seed=seed
+        )
+        gen_json = JsonformerClaude(
+            anthropic_client=client,
+            json_schema=schema,
+            prompt="Benchmark",
+            schema_format=schema_format,
+        )
+        asyncio.run(gen_json())
+        sent += client.prompt_bytes
+    return sent / args.repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--mistake-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    print(f"{'case':<12}{'format':<12}{'schema B':>10}{'prompt B':>10}{'sent B':>10}{'vs json':>10}")
+    for name, schema in EXAMPLES.items():
+        plan = compile_schema(schema)
+        baseline = None
+        for schema_format in SCHEMA_FORMATS:
+            text = render_schema(plan, schema_format)
+            gen_json = JsonformerClaude(
+                anthropic_client=None,
+                json_schema=plan,
+                prompt="Benchmark",
+                schema_format=schema_format,
+            )
+            sent = prompt_bytes(schema, schema_format, args)
+            baseline = baseline or sent
+            print(
+                f"{name:<12}{schema_format:<12}{len(text.encode()):>10}"
+                f"{len(gen_json.get_prompt().encode()):>10}{sent:>10.0f}{sent / baseline:>10.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
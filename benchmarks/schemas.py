@@ -0,0 +1,271 @@
+"""Schemas from the examples, used by the benchmarks."""
+
+CAR = {
+    "type": "object",
+    "properties": {
+        "car": {
+            "type": "object",
+            "properties": {
+                "make": {"type": "string"},
+                "model": {"type": "string"},
+                "year": {"type": "number"},
+                "VIN": {"type": "string"},
+                "colors": {"type": "array", "items": {"type": "string"}},
+                "features": {
+                    "type": "object",
+                    "properties": {
+                        "audio": {
+                            "type": "object",
+                            "properties": {
+                                "brand": {"type": "string"},
+                                "speakers": {"type": "number"},
+                                "hasBluetooth": {"type": "boolean"},
+                            },
+                        },
+                        "safety": {
+                            "type": "object",
+                            "properties": {
+                                "airbags": {"type": "number"},
+                                "parkingSensors": {"type": "boolean"},
+                                "laneAssist": {"type": "boolean"},
+                                "adaptiveCruiseControl": {"type": "boolean"},
+                                "blindSpotMonitoring": {"type": "boolean"},
+                            },
+                        },
+                        "performance": {
+                            "type": "object",
+                            "properties": {
+                                "engine": {"type": "string"},
+                                "horsepower": {"type": "number"},
+                                "topSpeed": {"type": "number"},
+                                "zeroToSixty": {"type": "number"},
+                            },
+                        },
+                    },
+                },
+                "maintenanceRecords": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "date": {"type": "string", "format": "date"},
+                            "servicePerformed": {"type": "string"},
+                            "partsReplaced": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                            },
+                        },
+                    },
+                },
+            },
+        },
+        "owner": {
+            "type": "object",
+            "properties": {
+                "firstName": {"type": "string"},
+                "lastName": {"type": "string"},
+                "age": {"type": "number"},
+                "licenseNumber": {"type": "string"},
+                "address": {
+                    "type": "object",
+                    "properties": {
+                        "street": {"type": "string"},
+                        "city": {"type": "string"},
+                        "state": {"type": "string"},
+                        "zip": {"type": "string"},
+                    },
+                },
+                "contactInfo": {
+                    "type": "object",
+                    "properties": {
+                        "email": {"type": "string", "format": "email"},
+                        "phoneNumber": {"type": "string"},
+                    },
+                },
+            },
+        },
+    },
+}
+
+
+GATSBY = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "characters": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "description": {"type": "string"},
+                },
+            },
+        },
+    },
+}
+
+
+ENUM = {
+    "properties": {
+        "is_car_slow": {
+            "type": "boolean"
+        },
+        "car_model_year": {
+            "type": "number",
+            "max": 1950,
+            "min": 1940
+        },
+        "car_name": {
+            "type": "string",
+        },
+        "car_type": {
+            "type": "string",
+            "enum": ["convertible", "speedy car", "electric"]
+        },
+    },
+}
+
+
+UNION = {
+    "definitions": {
+        "driver": {
+            "type": "object",
+            "properties": {
+                "person_type": {"type": "string", "enum": ["DRIVER"]},
+                "first_name": {"type": "string"},
+                "last_name": {"type": "string"},
+                "driving_skill": {"type": "number"}
+            }
+        },
+        "passenger": {
+            "type": "object",
+            "properties": {
+                "person_type": {"type": "string", "enum": ["PASSENGER"]},
+                "first_name": {"type": "string"},
+                "last_name": {"type": "string"},
+                "likliehood_to_throwup_out_of_100": {"type": "number"}
+            }
+        }
+    },
+    "properties": {
+        "is_car_slow": {
+            "type": "boolean"
+        },
+        "car_model_year": {
+            "type": "number",
+            "max": 2000,
+            "min": 1940
+        },
+        "car_name": {
+            "type": "string",
+        },
+        "car_type": {
+            "type": "string",
+            "enum": ["convertible", "speedy car", "electric"]
+        },
+        "people_in_car": {
+            "type": "array",
+            "items": {
+                "discriminator": {
+                    "propertyName": "person_type",
+                    "mapping": {
+                        "DRIVER": "#/definitions/driver",
+                        "PASSENGER": "#/definitions/passenger"
+                    }
+                }
+            }
+        }
+    },
+}
+
+
+RECURSION = {
+    "type": "object",
+    "definitions": {
+        "user": {
+            "type": "object",
+            "properties": {
+                "first_name": {"type": "string"},
+                "last_name": {"type": "string"}
+            }
+        }
+    },
+    "properties": {
+        "car": {
+            "type": "object",
+            "properties": {
+                "make": {"type": "string"},
+                "model": {"type": "string"},
+                "year": {"type": "number"},
+                "VIN": {"type": "string"},
+                "colors": {"type": "array", "items": {"type": "string"}},
+                "features": {
+                    "type": "object",
+                    "properties": {
+                        "audio": {
+                            "type": "object",
+                            "properties": {
+                                "brand": {"type": "string"},
+                                "speakers": {"type": "number"},
+                                "hasBluetooth": {"type": "boolean"},
+                            },
+                        },
+                        "safety": {
+                            "type": "object",
+                            "properties": {
+                                "airbags": {"type": "number"},
+                                "parkingSensors": {"type": "boolean"},
+                                "laneAssist": {"type": "boolean"},
+                                "adaptiveCruiseControl": {"type": "boolean"},
+                                "blindSpotMonitoring": {"type": "boolean"},
+                            },
+                        },
+                        "performance": {
+                            "type": "object",
+                            "properties": {
+                                "engine": {"type": "string"},
+                                "horsepower": {"type": "number"},
+                                "topSpeed": {"type": "number"},
+                                "zeroToSixty": {"type": "number"},
+                            },
+                        },
+                    },
+                },
+                "maintenanceRecords": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "date": {"type": "string", "format": "date"},
+                            "servicePerformed": {"type": "string"},
+                            "partsReplaced": {
+                                "type": "array",
+                                "items": {"type": "string"},
+                            },
+                        },
+                    },
+                },
+            },
+        },
+        "owner": {"$ref": "#/definitions/user"}
+    },
+}
+
+
+
+def wide(width: int) -> dict:
+    return {
+        "type": "object",
+        "properties": {f"field_{i}": {"type": "string"} for i in range(width)},
+    }
+
+
+def deep(depth: int) -> dict:
+    schema = {"type": "object", "properties": {"leaf": {"type": "number"}}}
+    for level in range(depth):
+        schema = {
+            "type": "object",
+            "properties": {"name": {"type": "string"}, f"level_{level}": schema},
+        }
+    return schema
@@ -1 +1,23 @@
-from jsonformer_claude.main import JsonformerClaude
+import importlib
+
+# Imported on first use, so light entry points such as `python -m
+# jsonformer_claude --help` don't pay for importing anthropic
+_EXPORTS = {
+    "JsonformerClaude": "jsonformer_claude.main",
+    "compile_schema": "jsonformer_claude.schema",
+    "generate_many": "jsonformer_claude.batch",
+    "ResponseCache": "jsonformer_claude.cache",
+    "Metrics": "jsonformer_claude.metrics",
+    "MetricsAggregator": "jsonformer_claude.metrics",
+    "SyncJsonformerClaude": "jsonformer_claude.sync",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name]), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,5 @@
+import sys
+
+from jsonformer_claude.cli import main
+
+sys.exit(main())
@@ -0,0 +1,343 @@
+import abc
+import asyncio
+import inspect
+import json
+import urllib.parse
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Tuple, Union
+
+import aiohttp
+import anthropic
+from anthropic import constants
+
+
+class CompletionBackend(abc.ABC):
+    """
+    The transport JsonformerClaude streams completions through.
+
+    `start` sends a prompt and returns an async iterator of the completion's
+    text, one new piece per item. Closing the iterator with `aclose()` cancels
+    the completion, which the engine does as soon as it stops reading a stream.
+    """
+
+    @abc.abstractmethod
+    async def start(
+        self, prompt: str, stop_sequences: List[str], **claude_args
+    ) -> AsyncIterator[str]:
+        ...
+
+    async def close(self):
+        """Releases connections the backend keeps open between completions."""
+
+    async def __aenter__(self) -> "CompletionBackend":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class ClientBackend(CompletionBackend):
+    """
+    Adapts a client with an anthropic 0.2 style `acompletion_stream`, which
+    yields the whole completion so far with every event, to text deltas.
+    """
+
+    def __init__(self, client: Any):
+        self.client = client
+
+    async def start(
+        self, prompt: str, stop_sequences: List[str], **claude_args
+    ) -> AsyncIterator[str]:
+        stream = await self.client.acompletion_stream(
+            prompt=prompt, stop_sequences=stop_sequences, **claude_args
+        )
+        return self._deltas(stream)
+
+    async def _deltas(self, stream) -> AsyncIterator[str]:
+        received = 0
+        try:
+            async for response in stream:
+                completion = response["completion"]
+                yield completion[received:]
+                received = len(completion)
+        finally:
+            if hasattr(stream, "aclose"):
+                await stream.aclose()
+
+
+class AnthropicBackend(CompletionBackend):
+    """
+    Streams from the Anthropic completion API over a pooled aiohttp session, so
+    connections are kept alive and reused across requests and generations
+    instead of being set up for every re-request.
+
+    At most `max_connections` connections are open at once, and at most
+    `concurrency` completions stream at once (the rest wait their turn).
+    """
+
+    def __init__(
+        self,
+        client: Union[anthropic.Client, str],
+        max_connections: int = 32,
+        concurrency: int | None = None,
+        keepalive_timeout: float = 60.0,
+    ):
+        if isinstance(client, str):
+            client = anthropic.Client(client)
+        self.api_key = client.api_key
+        self.url = urllib.parse.urljoin(client.api_url, "v1/complete")
+        self.proxy_url = client.proxy_url
+        self.timeout = aiohttp.ClientTimeout(total=client.default_request_timeout)
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+        self.session: aiohttp.ClientSession | None = None
+        self.session_loop: asyncio.AbstractEventLoop | None = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        # A session only works on the loop it was created on, e.g. not across
+        # separate asyncio.run calls
+        if self.session is None or self.session.closed or self.session_loop is not loop:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections, keepalive_timeout=self.keepalive_timeout
+                ),
+                timeout=self.timeout,
+            )
+            self.session_loop = loop
+        return self.session
+
+    async def start(
+        self, prompt: str, stop_sequences: List[str], **claude_args
+    ) -> AsyncIterator[str]:
+        params = {
+            "prompt": prompt,
+            "stop_sequences": stop_sequences,
+            "stream": True,
+            **claude_args,
+        }
+        return self._stream(params)
+
+    async def _stream(self, params: dict) -> AsyncIterator[str]:
+        headers = {
+            "Accept": "application/json",
+            "Anthropic-SDK": constants.ANTHROPIC_CLIENT_VERSION,
+            "Anthropic-Version": constants.ANTHROPIC_VERSION,
+            "X-API-Key": self.api_key,
+            "Content-Type": "application/json",
+        }
+        if self.semaphore is not None:
+            await self.semaphore.acquire()
+        try:
+            async with self.get_session().post(
+                self.url, data=json.dumps(params), headers=headers, proxy=self.proxy_url
+            ) as response:
+                if response.status != 200:
+                    raise anthropic.ApiException(
+                        f"post request failed with status code: {response.status}",
+                        await response.text(),
+                    )
+                received = 0
+                awaiting_ping_data = False
+                async for line in response.content:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    if line == b"event: ping":
+                        awaiting_ping_data = True
+                        continue
+                    if awaiting_ping_data:
+                        awaiting_ping_data = False
+                        continue
+                    if line == b"data: [DONE]":
+                        continue
+                    if line.startswith(b"data: "):
+                        line = line[len(b"data: ") :]
+                    completion = json.loads(line)["completion"]
+                    yield completion[received:]
+                    received = len(completion)
+        finally:
+            if self.semaphore is not None:
+                self.semaphore.release()
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+
+class LocalBackend(CompletionBackend):
+    """
+    An in-process backend for tests: `complete` maps a prompt to its whole
+    completion (or an awaitable of it), which is streamed back in chunks of
+    `chunk_size` characters, `chunk_latency` seconds apart.
+    """
+
+    def __init__(
+        self,
+        complete: Callable[[str], Union[str, Awaitable[str]]],
+        chunk_size: int = 8,
+        chunk_latency: float = 0.0,
+    ):
+        self.complete = complete
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.prompts: List[str] = []
+
+    async def start(
+        self, prompt: str, stop_sequences: List[str], **claude_args
+    ) -> AsyncIterator[str]:
+        self.prompts.append(prompt)
+        completion = self.complete(prompt)
+        if inspect.isawaitable(completion):
+            completion = await completion
+        for stop in stop_sequences:
+            if stop in completion:
+                completion = completion[: completion.index(stop)]
+        return self._stream(completion)
+
+    async def _stream(self, completion: str) -> AsyncIterator[str]:
+        for start in range(0, len(completion), self.chunk_size):
+            await asyncio.sleep(self.chunk_latency)
+            yield completion[start : start + self.chunk_size]
+
+
+class HedgedStream:
+    """
+    A stream from HedgedBackend. `fired` and `won` count the hedges of this
+    stream alone, where the backend's counters add up every stream it served.
+    """
+
+    def __init__(self):
+        self.fired = 0
+        self.won = 0
+        self.race: AsyncIterator[str] | None = None
+
+    def __aiter__(self) -> "HedgedStream":
+        return self
+
+    async def __anext__(self) -> str:
+        return await self.race.__anext__()
+
+    async def aclose(self):
+        await self.race.aclose()
+
+
+class HedgedBackend(CompletionBackend):
+    """
+    Hedges slow streams: when a stream from `backend` hasn't produced its first
+    or next chunk within `deadline` seconds, a duplicate request is sent and
+    whichever of the two delivers first is kept, the other one being cancelled.
+
+    A hedge sent partway through a stream asks to continue from the text
+    received so far, so the winner's chunks always follow on from it. At most
+    `max_hedges` are sent per stream. `fired` and `won` count the hedges sent
+    and the ones that delivered first, over all streams; each HedgedStream
+    counts its own too.
+    """
+
+    def __init__(self, backend: CompletionBackend, deadline: float, max_hedges: int = 1):
+        self.backend = backend
+        self.deadline = deadline
+        self.max_hedges = max_hedges
+        self.fired = 0
+        self.won = 0
+
+    async def start(
+        self, prompt: str, stop_sequences: List[str], **claude_args
+    ) -> HedgedStream:
+        # The backend is started inside the race, so a slow start() is hedged
+        # like a slow first chunk
+        hedged = HedgedStream()
+        hedged.race = self._race(hedged, prompt, stop_sequences, claude_args)
+        return hedged
+
+    async def _race(
+        self, hedged: HedgedStream, prompt: str, stop_sequences: List[str], claude_args
+    ) -> AsyncIterator[str]:
+        received: List[str] = []
+        hedges = 0
+        stream: AsyncIterator[str] | None = None
+        pending: asyncio.Future | None = asyncio.ensure_future(
+            self._open(prompt, stop_sequences, claude_args)
+        )
+        try:
+            while True:
+                if hedges < self.max_hedges:
+                    done, _ = await asyncio.wait({pending}, timeout=self.deadline)
+                    if not done:
+                        hedges += 1
+                        self.fired += 1
+                        hedged.fired += 1
+                        first = await self._hedge(
+                            pending, prompt + "".join(received), stop_sequences, claude_args
+                        )
+                        if first is not pending:
+                            self.won += 1
+                            hedged.won += 1
+                        pending = first
+                stream, delta = await pending
+                pending = None
+                if delta is None:
+                    return
+                received.append(delta)
+                yield delta
+                pending = asyncio.ensure_future(self._next(stream))
+        finally:
+            if pending is not None:
+                await self._discard(pending)
+            if stream is not None:
+                await stream.aclose()
+
+    async def _open(
+        self, prompt: str, stop_sequences: List[str], claude_args
+    ) -> Tuple[AsyncIterator[str], str | None]:
+        """Starts a stream and reads its first chunk."""
+        stream = await self.backend.start(prompt, stop_sequences, **claude_args)
+        return await self._next(stream)
+
+    async def _next(self, stream: AsyncIterator[str]) -> Tuple[AsyncIterator[str], str | None]:
+        """`stream` and its next chunk, None once it has ended."""
+        try:
+            return stream, await stream.__anext__()
+        except StopAsyncIteration:
+            return stream, None
+        except BaseException:
+            # Cancelled as the loser of a race, or failed
+            await stream.aclose()
+            raise
+
+    async def _discard(self, read: asyncio.Future):
+        """Cancels a read from `_open` or `_next`, closing its stream."""
+        read.cancel()
+        (result,) = await asyncio.gather(read, return_exceptions=True)
+        if not isinstance(result, BaseException):
+            # It finished before it could be cancelled
+            await result[0].aclose()
+
+    async def _hedge(
+        self,
+        pending: asyncio.Future,
+        prompt: str,
+        stop_sequences: List[str],
+        claude_args,
+    ) -> asyncio.Future:
+        """Races a duplicate of the stream `pending` reads, returning the first read."""
+        hedge = asyncio.ensure_future(self._open(prompt, stop_sequences, claude_args))
+        try:
+            await asyncio.wait({pending, hedge}, return_when=asyncio.FIRST_COMPLETED)
+        except BaseException:
+            await self._discard(hedge)
+            raise
+        if pending.done():
+            await self._discard(hedge)
+            return pending
+        await self._discard(pending)
+        return hedge
+
+
+def as_backend(client: Any) -> CompletionBackend:
+    """`client` itself if it is a backend, otherwise an adapter around it."""
+    if isinstance(client, CompletionBackend):
+        return client
+    return ClientBackend(client)
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, Iterable, List, Union
+
+import anthropic
+
+from jsonformer_claude.backends import CompletionBackend
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.schema import SchemaPlan, compile_schema
+
+
+@dataclass
+class BatchItem:
+    index: int
+    prompt: str
+    value: Dict[str, Any] | None = None
+    error: BaseException | None = None
+    request_count: int = 0
+    elapsed: float = 0.0
+    # JSON pointers filled in for lack of budget, see JsonformerClaude.incomplete
+    incomplete: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class BatchStats:
+    objects: int = 0
+    failures: int = 0
+    requests: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def objects_per_second(self) -> float:
+        return self.objects / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def requests_per_object(self) -> float:
+        return self.requests / self.objects if self.objects else 0.0
+
+
+@dataclass
+class BatchResult:
+    items: List[BatchItem] = field(default_factory=list)
+    stats: BatchStats = field(default_factory=BatchStats)
+
+    @property
+    def values(self) -> List[Dict[str, Any] | None]:
+        return [item.value for item in self.items]
+
+    @property
+    def failures(self) -> List[BatchItem]:
+        return [item for item in self.items if not item.ok]
+
+
+class BatchGenerator:
+    """
+    Generates one object per prompt with a shared schema plan and client, keeping
+    at most `concurrency` generations streaming at once.
+    """
+
+    def __init__(
+        self,
+        anthropic_client: Union[anthropic.Client, CompletionBackend],
+        json_schema: Union[Dict[str, Any], SchemaPlan],
+        concurrency: int = 8,
+        debug: bool = False,
+        **claude_args,
+    ):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if isinstance(json_schema, SchemaPlan):
+            self.plan = json_schema
+        else:
+            self.plan = compile_schema(json_schema)
+        self.anthropic_client = anthropic_client
+        self.concurrency = concurrency
+        self.debug = debug
+        self.claude_args = claude_args
+        self.stats = BatchStats()
+
+    async def generate_one(self, index: int, prompt: str) -> BatchItem:
+        item = BatchItem(index=index, prompt=prompt)
+        gen_json = JsonformerClaude(
+            anthropic_client=self.anthropic_client,
+            json_schema=self.plan,
+            prompt=prompt,
+            debug=self.debug,
+            **self.claude_args,
+        )
+        start = time.perf_counter()
+        try:
+            item.value = await gen_json()
+        except Exception as e:
+            item.error = e
+        item.elapsed = time.perf_counter() - start
+        item.request_count = gen_json.llm_request_count
+        item.incomplete = gen_json.incomplete
+        return item
+
+    async def as_completed(self, prompts: Iterable[str]) -> AsyncIterator[BatchItem]:
+        """Yields items as their generations finish, failures included."""
+        pending = iter(enumerate(prompts))
+        results: asyncio.Queue = asyncio.Queue()
+        self.stats = BatchStats()
+        start = time.perf_counter()
+
+        async def worker():
+            for index, prompt in pending:
+                await results.put(await self.generate_one(index, prompt))
+            await results.put(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+        running = len(workers)
+        try:
+            while running:
+                item = await results.get()
+                if item is None:
+                    running -= 1
+                    continue
+                self.stats.objects += 1
+                self.stats.failures += not item.ok
+                self.stats.requests += item.request_count
+                self.stats.elapsed = time.perf_counter() - start
+                yield item
+        finally:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def run(self, prompts: Iterable[str]) -> BatchResult:
+        items = [item async for item in self.as_completed(prompts)]
+        items.sort(key=lambda item: item.index)
+        return BatchResult(items=items, stats=self.stats)
+
+
+async def generate_many(
+    anthropic_client: Union[anthropic.Client, CompletionBackend],
+    prompts: Iterable[str],
+    json_schema: Union[Dict[str, Any], SchemaPlan],
+    concurrency: int = 8,
+    debug: bool = False,
+    **claude_args,
+) -> BatchResult:
+    """
+    Generates an object for every prompt, returning them in prompt order along
+    with throughput statistics. A failing prompt is reported on its item instead
+    of aborting the batch.
+    """
+    batch = BatchGenerator(
+        anthropic_client=anthropic_client,
+        json_schema=json_schema,
+        concurrency=concurrency,
+        debug=debug,
+        **claude_args,
+    )
+    return await batch.run(prompts)
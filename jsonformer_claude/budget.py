@@ -0,0 +1,51 @@
+import time
+from typing import NoReturn
+
+DEADLINE = "deadline"
+REQUESTS = "requests"
+
+
+class BudgetExhausted(Exception):
+    def __init__(self, reason: str):
+        super().__init__(f"generation ran out of its {reason} budget")
+        self.reason = reason
+
+
+class Budget:
+    """
+    The time and the number of completion requests one generation may spend,
+    shared with its forks. `deadline` is in seconds from `start`; None on
+    either means no limit. `exhausted` is the reason it first ran out.
+    """
+
+    def __init__(self, deadline: float | None = None, max_requests: int | None = None):
+        self.deadline = deadline
+        self.max_requests = max_requests
+        self.expires: float | None = None
+        self.requests = 0
+        self.exhausted: str | None = None
+
+    def start(self):
+        self.expires = None if self.deadline is None else time.monotonic() + self.deadline
+        self.requests = 0
+        self.exhausted = None
+
+    def remaining(self) -> float | None:
+        """Seconds left before the deadline, or None without one."""
+        if self.expires is None:
+            return None
+        return self.expires - time.monotonic()
+
+    def charge(self):
+        """Accounts for a completion request, raising if there is no budget for it."""
+        if self.max_requests is not None and self.requests >= self.max_requests:
+            self.exhaust(REQUESTS)
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            self.exhaust(DEADLINE)
+        self.requests += 1
+
+    def exhaust(self, reason: str) -> NoReturn:
+        if self.exhausted is None:
+            self.exhausted = reason
+        raise BudgetExhausted(reason)
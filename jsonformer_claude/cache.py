@@ -0,0 +1,173 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from jsonformer_claude.schema import SchemaPlan
+
+MISSING = object()
+
+
+class ResponseCache:
+    """
+    Memoizes finished generations, keyed on the prompt, the compiled schema and
+    the Claude arguments.
+
+    Entries live in an in-memory LRU, backed by a SQLite file when `path` is
+    given so they survive restarts and can be shared between processes. `ttl`
+    expires entries after that many seconds, and `max_entries` /
+    `max_disk_entries` bound both stores. Concurrent requests for the same key
+    share a single generation. With `completions=True` the raw completion of
+    every finished stream is kept too, keyed by the exact prompt, so a re-run
+    that gets to the same prompt replays it instead of calling Claude.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        ttl: float | None = None,
+        max_entries: int = 1024,
+        max_disk_entries: int = 100_000,
+        completions: bool = False,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.completions = completions
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: "OrderedDict[str, Tuple[float | None, str]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries "
+                "(key TEXT PRIMARY KEY, value TEXT, expires REAL, accessed REAL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def key(prompt: str, plan: SchemaPlan, claude_args: Dict[str, Any], **options) -> str:
+        """`options` are the engine options that change the value, e.g. `defaults`."""
+        text = json.dumps(
+            [prompt, plan.key, claude_args, options], sort_keys=True, default=str
+        )
+        return "value:" + hashlib.sha256(text.encode()).hexdigest()
+
+    def completion_key(self, prompt: str) -> str:
+        return "completion:" + hashlib.sha256(prompt.encode()).hexdigest()
+
+    def get(self, key: str) -> Any:
+        """Returns a fresh copy of the cached value, or MISSING."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, text = entry
+                if expires is None or expires > now:
+                    self._memory.move_to_end(key)
+                    return json.loads(text)
+                del self._memory[key]
+
+            if self._db is None:
+                return MISSING
+            row = self._db.execute(
+                "SELECT value, expires FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return MISSING
+            text, expires = row
+            if expires is not None and expires <= now:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+                return MISSING
+            self._db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, expires, text)
+            return json.loads(text)
+
+    def set(self, key: str, value: Any):
+        text = json.dumps(value)
+        expires = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._remember(key, expires, text)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, text, expires, time.time()),
+            )
+            self._db.execute(
+                "DELETE FROM entries WHERE key IN (SELECT key FROM entries "
+                "ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+            self._db.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+
+    def _remember(self, key: str, expires: float | None, text: str):
+        self._memory[key] = (expires, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get_completion(self, prompt: str) -> str | None:
+        if not self.completions:
+            return None
+        completion = self.get(self.completion_key(prompt))
+        return None if completion is MISSING else completion
+
+    def set_completion(self, prompt: str, completion: str):
+        if self.completions:
+            self.set(self.completion_key(prompt), completion)
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Returns the cached value for `key`, awaiting `create` on a miss. Callers
+        that miss on a key already being created wait for that result.
+        """
+        value = self.get(key)
+        if value is not MISSING:
+            self.hits += 1
+            return value
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            value = await asyncio.shield(inflight)
+            return json.loads(json.dumps(value))
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await create()
+        except BaseException as e:
+            future.set_exception(e)
+            # Followers get the exception; don't warn if there are none
+            future.exception()
+            raise
+        else:
+            self.set(key, value)
+            future.set_result(value)
+            return value
+        finally:
+            del self._inflight[key]
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
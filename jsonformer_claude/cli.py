@@ -0,0 +1,244 @@
+"""
+Generates one object per prompt of a JSONL file.
+
+    python -m jsonformer_claude schema.json prompts.jsonl -o results.jsonl
+    cat prompts.jsonl | python -m jsonformer_claude schema.json - --concurrency 16
+
+Each input line is {"id": ..., "prompt": "..."} or just a JSON string, whose id
+is then its line number. Results are written as {"id": ..., "value": {...}} or
+{"id": ..., "error": "..."} as soon as each generation finishes, with the
+"incomplete" pointers of a value cut short by --deadline or --max-requests.
+Rerunning with the same output file skips the ids that already have a whole
+value and retries the others; the last line written for an id is its result.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Set, TextIO, Tuple
+
+
+def parse_args(argv: List[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m jsonformer_claude",
+        description=__doc__.strip().splitlines()[0],
+        epilog="\n".join(__doc__.strip().splitlines()[1:]),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument("schema", help="JSON schema file")
+    parser.add_argument("prompts", help="JSONL file of prompts, or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL file to append results to (default stdout)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--model", default="claude-instant-v1")
+    parser.add_argument("--max-tokens-to-sample", type=int, default=1000)
+    parser.add_argument("--temperature", type=float)
+    parser.add_argument(
+        "--claude-arg",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="extra completion argument, VALUE parsed as JSON when it can be",
+    )
+    parser.add_argument("--api-key", help="defaults to $ANTHROPIC_API_KEY or $ANTHROPIC")
+    parser.add_argument("--speculative", action="store_true")
+    parser.add_argument("--parallel", action="store_true")
+    parser.add_argument("--cache", metavar="PATH", help="SQLite file to cache generations in")
+    parser.add_argument(
+        "--hedge-after",
+        type=float,
+        metavar="SECONDS",
+        help="send a duplicate request when a stream stalls this long",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        metavar="SECONDS",
+        help="time per object, after which missing values are filled with defaults",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        help="completion requests per object, after which the same happens",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=float,
+        default=10.0,
+        help="seconds between progress lines on stderr, 0 for none",
+    )
+    parser.add_argument(
+        "--mock",
+        action="store_true",
+        help="generate offline with the mock client, e.g. to try a schema",
+    )
+    return parser.parse_args(argv)
+
+
+def claude_args(args: argparse.Namespace) -> Dict[str, Any]:
+    extra = {"model": args.model, "max_tokens_to_sample": args.max_tokens_to_sample}
+    if args.temperature is not None:
+        extra["temperature"] = args.temperature
+    for item in args.claude_arg:
+        key, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--claude-arg expects KEY=VALUE, got {item!r}")
+        try:
+            extra[key] = json.loads(value)
+        except ValueError:
+            extra[key] = value
+    return extra
+
+
+def read_prompts(lines: TextIO) -> Iterator[Tuple[Any, str]]:
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if isinstance(record, str):
+            yield number, record
+        else:
+            yield record.get("id", number), record["prompt"]
+
+
+def completed_ids(path: str | None) -> Set[str]:
+    """Ids, as JSON text, that the output file already has a whole value for."""
+    done = set()
+    if path is None or not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run
+                continue
+            key = json.dumps(record.get("id"))
+            if "value" in record and not record.get("incomplete"):
+                done.add(key)
+            else:
+                done.discard(key)
+    return done
+
+
+def ends_mid_line(path: str) -> bool:
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+class Progress:
+    def __init__(self, interval: float, skipped: int):
+        self.interval = interval
+        self.skipped = skipped
+        self.last_report = time.monotonic()
+
+    def report(self, stats, final: bool = False):
+        now = time.monotonic()
+        if not final and (not self.interval or now - self.last_report < self.interval):
+            return
+        self.last_report = now
+        print(
+            f"{'done' if final else 'progress'}: {stats.objects} objects"
+            f" ({stats.failures} failed, {self.skipped} skipped) in {stats.elapsed:.1f}s,"
+            f" {stats.objects_per_second:.2f} objects/s,"
+            f" {stats.requests_per_object:.2f} requests/object",
+            file=sys.stderr,
+        )
+
+
+def make_client(args: argparse.Namespace, schema: Dict[str, Any]):
+    if args.mock:
+        from jsonformer_claude.mock import MockAnthropicClient
+
+        return MockAnthropicClient.from_schema(schema)
+
+    from jsonformer_claude.backends import AnthropicBackend
+
+    api_key = args.api_key or os.environ.get("ANTHROPIC_API_KEY") or os.environ.get("ANTHROPIC")
+    if not api_key:
+        raise SystemExit("No API key: pass --api-key or set ANTHROPIC_API_KEY")
+    # Keep-alive connections shared by every generation of the batch
+    return AnthropicBackend(api_key, max_connections=max(32, 2 * args.concurrency))
+
+
+async def run(args: argparse.Namespace, output: TextIO) -> int:
+    from jsonformer_claude.batch import BatchGenerator
+
+    with open(args.schema) as f:
+        schema = json.load(f)
+    done = completed_ids(args.output)
+
+    engine_args: Dict[str, Any] = {
+        "speculative": args.speculative,
+        "parallel": args.parallel,
+        "hedge_after": args.hedge_after,
+        "deadline": args.deadline,
+        "max_requests": args.max_requests,
+    }
+    if args.cache:
+        from jsonformer_claude.cache import ResponseCache
+
+        engine_args["cache"] = ResponseCache(path=args.cache)
+
+    client = make_client(args, schema)
+    batch = BatchGenerator(
+        anthropic_client=client,
+        json_schema=schema,
+        concurrency=args.concurrency,
+        **engine_args,
+        **claude_args(args),
+    )
+    ids = []
+    progress = Progress(args.progress_interval, skipped=0)
+
+    def pending(lines: TextIO) -> Iterator[str]:
+        # Read lazily as workers free up, so a large input isn't loaded at once
+        for id, prompt in read_prompts(lines):
+            if json.dumps(id) in done:
+                progress.skipped += 1
+                continue
+            ids.append(id)
+            yield prompt
+
+    lines = sys.stdin if args.prompts == "-" else open(args.prompts)
+    try:
+        async for item in batch.as_completed(pending(lines)):
+            if item.ok:
+                record = {"id": ids[item.index], "value": item.value}
+                if item.incomplete:
+                    record["incomplete"] = item.incomplete
+            else:
+                record = {
+                    "id": ids[item.index],
+                    "error": f"{type(item.error).__name__}: {item.error}",
+                }
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            progress.report(batch.stats)
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        if "cache" in engine_args:
+            engine_args["cache"].close()
+        if hasattr(client, "close"):
+            await client.close()
+
+    progress.report(batch.stats, final=True)
+    return 1 if batch.stats.failures else 0
+
+
+def main(argv: List[str] | None = None) -> int:
+    args = parse_args(argv)
+    if args.concurrency < 1:
+        raise SystemExit("--concurrency must be at least 1")
+    if args.output is None:
+        return asyncio.run(run(args, sys.stdout))
+    with open(args.output, "a") as output:
+        if ends_mid_line(args.output):
+            # Left by an interrupted run, so the first new result gets a line of its own
+            output.write("\n")
+        return asyncio.run(run(args, output))
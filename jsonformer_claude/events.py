@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+from typing import Any, Iterable, Union
+
+VALUE = "value"
+START_OBJECT = "start_object"
+END_OBJECT = "end_object"
+START_ARRAY = "start_array"
+END_ARRAY = "end_array"
+
+
+@dataclass(frozen=True)
+class FieldEvent:
+    kind: str
+    # JSON pointer (RFC 6901) of the value, "" for the root object
+    pointer: str
+    value: Any = None
+
+
+def json_pointer(path: Iterable[Union[str, int]]) -> str:
+    return "".join(
+        "/" + str(part).replace("~", "~0").replace("/", "~1") for part in path
+    )
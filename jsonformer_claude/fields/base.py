@@ -1,8 +1,16 @@
+import json
 import re
-from typing import Any
+from typing import Any, Callable, List
 
 from dataclasses import dataclass
 
+STRING = "string"
+NUMBER = "number"
+LITERAL = "literal"
+
+LITERALS = {"t": "true", "f": "false", "n": "null"}
+NUMBER_CHARS = frozenset("0123456789+-.eE")
+NUMBER_GRAMMAR = re.compile(r"-?(0|[1-9][0-9]*)(\.[0-9]+)?([eE][+-]?[0-9]+)?")
 
 
 @dataclass
@@ -10,42 +18,187 @@ class FieldResponse:
     value_found: bool
     value_valid: bool
     value: Any | None
+    # The JSON text of the value exactly as it was streamed
+    text: str | None = None
+
+
+class FieldParser:
+    """
+    Resumable tokenizer for one streamed scalar.
+
+    Each call to `feed` consumes only the new characters, keeping the scan state
+    (inside a string, after a backslash, partway through a literal) between
+    chunks, so parsing a value costs O(length) however it is chunked. A result
+    is reported as soon as the token is complete: at the closing quote of a
+    string, at the last letter of true, false or null, and at the first
+    character after a number. A token the field's prefix check rejects is
+    reported invalid at the first character that rules it out.
+    """
+
+    def __init__(self, field: "BaseField"):
+        self.field = field
+        self.kind: str | None = None
+        self.parts: List[str] = []
+        self.literal = ""
+        self.length = 0
+        self.backslashes = 0
+        self.result: FieldResponse | None = None
+        self.check = field.prefix_check()
+
+    def feed(self, delta: str) -> FieldResponse:
+        if self.result is not None:
+            return self.result
+        if not delta:
+            return FieldResponse(value_found=False, value_valid=False, value=None)
+
+        if self.kind is None:
+            first = delta[0]
+            if first == '"':
+                self.kind = STRING
+                self.parts.append(first)
+                self.length = 1
+                delta = delta[1:]
+            elif first in LITERALS:
+                self.kind = LITERAL
+                self.literal = LITERALS[first]
+            elif first == "-" or first.isdigit():
+                self.kind = NUMBER
+            else:
+                # Nothing a JSON scalar can start with
+                return self.finish(delta[0], None)
+            if not (
+                self.field.accepts(self.kind, None)
+                or (self.literal == "null" and self.field.nullable())
+            ):
+                return self.finish(delta[:1], None)
+
+        if self.kind == STRING:
+            end = self.scan_string(delta)
+        elif self.kind == LITERAL:
+            end = self.scan_literal(delta)
+        else:
+            end = self.scan_number(delta)
+
+        if end is None:
+            self.parts.append(delta)
+            self.length += len(delta)
+            if self.check is not None and not self.check(self.kind, delta):
+                return self.finish("".join(self.parts), None)
+            return FieldResponse(value_found=False, value_valid=False, value=None)
+        self.parts.append(delta[:end])
+        text = "".join(self.parts)
+
+        if self.kind == LITERAL and text != self.literal:
+            return self.finish(text, None)
+        if self.kind == NUMBER and not NUMBER_GRAMMAR.fullmatch(text):
+            return self.finish(text, None)
+        try:
+            # Claude sometimes puts raw newlines in strings, which is fine here
+            value = json.loads(text, strict=False)
+        except ValueError:
+            # e.g. an unknown escape
+            return self.finish(text, None)
+        return self.finish(text, value)
+
+    def scan_string(self, delta: str) -> int | None:
+        """Returns the position just after the closing quote, if `delta` has it."""
+        pos = 0
+        while True:
+            quote = delta.find('"', pos)
+            segment = delta[pos:] if quote == -1 else delta[pos:quote]
+            trailing = len(segment) - len(segment.rstrip("\\"))
+            if trailing == len(segment):
+                self.backslashes += trailing
+            else:
+                self.backslashes = trailing
+            if quote == -1:
+                return None
+            escaped = self.backslashes % 2
+            self.backslashes = 0
+            if not escaped:
+                return quote + 1
+            pos = quote + 1
+
+    def scan_literal(self, delta: str) -> int | None:
+        needed = len(self.literal) - self.length
+        if len(delta) < needed:
+            if not self.literal.startswith(delta, self.length):
+                # Wrong already, no need to wait for the rest
+                return len(delta)
+            return None
+        return needed
+
+    def scan_number(self, delta: str) -> int | None:
+        for index, char in enumerate(delta):
+            if char not in NUMBER_CHARS:
+                return index
+        return None
+
+    def finish(self, text: str, value: Any) -> FieldResponse:
+        field = self.field
+        if value is None and text != "null":
+            self.result = FieldResponse(
+                value_found=True, value_valid=False, value=text, text=text
+            )
+        elif value is None:
+            valid = field.nullable()
+            self.result = FieldResponse(
+                value_found=True, value_valid=valid, value=None if valid else text, text=text
+            )
+        elif field.accepts(self.kind, value) and field.validate_value(val=field.token_text(text, value)):
+            self.result = FieldResponse(
+                value_found=True,
+                value_valid=True,
+                value=field.postprocess_value(val=field.token_text(text, value)),
+                text=text,
+            )
+        else:
+            self.result = FieldResponse(
+                value_found=True, value_valid=False, value=value, text=text
+            )
+        return self.result
 
 
 class BaseField():
     schema = None
-    end_tokens = [",", "}"]
-    obj = None
-    key = None
-    generation_marker = None
 
-    def __init__(self, schema: dict, obj: Any, key: str, generation_marker: str):
+    def __init__(self, schema: dict):
         self.schema = schema
-        self.obj = obj
-        self.key = key
-        self.generation_marker = generation_marker
 
-    def insert_generation_marker(self):
-        if type(self.obj) is dict:
-            self.obj[self.key] = self.generation_marker
+    def parser(self) -> FieldParser:
+        """A fresh tokenizer for the next streamed value of this field."""
+        return FieldParser(self)
 
-        if type(self.obj) is list:
-            self.obj.append(self.generation_marker)
+    def accepts(self, kind: str, value: Any) -> bool:
+        """
+        Whether a token of `kind` can be a value of this field; `value` is None
+        while the token is still streaming.
+        """
+        return True
 
-    def get_value(self, stream: str) -> str | None:
+    def prefix_check(self) -> Callable[[str, str], bool] | None:
         """
-        Will return None if a terminating characters has not yet been found.
+        A check fed each new piece of an incomplete token along with the token's
+        kind, returning False once no continuation can be valid. Tokens of
+        a kind the check doesn't cover, e.g. a null, must pass. None if the
+        field has no constraints worth checking early.
+        """
+        return None
+
+    def nullable(self) -> bool:
+        return self.schema.get("nullable") is True
+
+    def token_text(self, text: str, value: Any) -> str:
+        """The text validate_value and postprocess_value receive for a token."""
+        return text
 
-        If a terminating character has been found, it'll return that value for processing.
+    def get_value(self, stream: str) -> str | None:
         """
-        value = []
+        Will return None if the value in `stream` is not complete yet.
 
-        for char in stream:
-            if char not in self.end_tokens:
-                value.append(char)
-            else:
-                return "".join(value)
-        return None
+        Once it is, it'll return that value's text for processing.
+        """
+        return self.parser().feed(stream).text
 
     def validate_value(self, val: str) -> bool:
         return True
@@ -53,25 +206,5 @@ class BaseField():
     def postprocess_value(self, val: str) -> Any:
         return val
 
-    def generate_value(self, stream: str) -> Any:
-        value = self.get_value(stream=stream)
-
-        if value is not None and self.validate_value(val=value):
-            value = self.postprocess_value(val=value)
-            return FieldResponse(
-                value_found=True,
-                value_valid=True,
-                value=value
-            )
-        elif value is not None and not self.validate_value(val=value):
-            return FieldResponse(
-                value_found=True,
-                value_valid=False,
-                value=value
-            )
-
-        return FieldResponse(
-            value_found=False,
-            value_valid=False,
-            value=None
-        )
+    def generate_value(self, stream: str) -> FieldResponse:
+        return self.parser().feed(stream)
@@ -1,7 +1,10 @@
-from jsonformer_claude.fields.base import BaseField
+from jsonformer_claude.fields.base import LITERAL, BaseField
 
 
 class BoolField(BaseField):
+    def accepts(self, kind: str, value) -> bool:
+        return kind == LITERAL
+
     def validate_value(self, val: str) -> bool:
         return val in ["true", "false"]
 
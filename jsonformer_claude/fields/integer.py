@@ -1,10 +1,58 @@
-from jsonformer_claude.fields.base import BaseField
+from jsonformer_claude.fields.base import NUMBER, BaseField
+
+
+def is_integer_text(val: str) -> bool:
+    return not any(char in val for char in ".eE")
+
+
+class NumberPrefixCheck:
+    """
+    Checks a streaming number against `min` and `max` as its digits arrive.
+
+    More digits only move a number away from zero, so a positive prefix above
+    `max`, or a negative one below `min`, stays out of range. This assumes no
+    negative exponent follows; once an exponent starts the check stops.
+    """
+
+    def __init__(self, schema: dict):
+        self.min = schema.get("min")
+        self.max = schema.get("max")
+        self.text = ""
+
+    def __call__(self, kind: str, delta: str) -> bool:
+        if kind != NUMBER:
+            # e.g. the null of a nullable number
+            return True
+        self.text += delta
+        text = self.text
+        if "e" in text or "E" in text:
+            return True
+        if text == "-":
+            return self.min is None or self.min < 0
+        try:
+            value = float(text.rstrip("."))
+        except ValueError:
+            # Malformed, the final check rejects it
+            return True
+        if self.max is not None and value > self.max and not text.startswith("-"):
+            return False
+        if self.min is not None and value < self.min and text.startswith("-"):
+            return False
+        return True
 
 
 class IntField(BaseField):
+    def accepts(self, kind: str, value) -> bool:
+        return kind == NUMBER
+
+    def prefix_check(self) -> NumberPrefixCheck | None:
+        if "min" not in self.schema and "max" not in self.schema:
+            return None
+        return NumberPrefixCheck(self.schema)
+
     def validate_value(self, val: str) -> bool:
         try:
-            if val.isdigit():
+            if is_integer_text(val):
                 val = int(val)
             else:
                 val = float(val)
@@ -20,4 +68,4 @@ class IntField(BaseField):
             return False
 
     def postprocess_value(self, val: str) -> int | float:
-        return int(val) if val.isdigit() else float(val)
+        return int(val) if is_integer_text(val) else float(val)
@@ -1,18 +1,147 @@
-from jsonformer_claude.fields.base import BaseField
+import json
+import re
+from typing import Any, Dict
 
+from jsonformer_claude.fields.base import STRING, BaseField
 
-class StrField(BaseField):
-    def validate_value(self, val: str) -> str:
-        if "enum" not in self.schema:
+try:
+    import regex
+except ImportError:  # Patterns are then only checked once the string is complete
+    regex = None
+
+FORMATS = {
+    "date": re.compile(r"\d{4}-\d{2}-\d{2}"),
+    "date-time": re.compile(
+        r"\d{4}-\d{2}-\d{2}[Tt ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?([Zz]|[+-]\d{2}:\d{2})?"
+    ),
+    "email": re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+"),
+}
+# What each position of a formatted string's fixed-width start must be: d for
+# a digit, ? for anything, $ for the end of the string
+FORMAT_TEMPLATES = {
+    "date": "dddd-dd-dd$",
+    "date-time": "dddd-dd-dd?dd:dd",
+}
+
+
+def build_trie(values) -> Dict[str, Any]:
+    """A prefix trie over the raw JSON text of each value, without its quotes."""
+    trie: Dict[str, Any] = {}
+    for value in values:
+        for text in {json.dumps(value)[1:-1], json.dumps(value, ensure_ascii=False)[1:-1]}:
+            node = trie
+            for char in text:
+                node = node.setdefault(char, {})
+    return trie
+
+
+class StringPrefixCheck:
+    """
+    Follows a streaming string's raw text through the enum trie, counts its
+    decoded length and matches its start against the format, so a value that
+    can no longer be valid is rejected at the first character that rules it out.
+    """
+
+    def __init__(self, field: "StrField"):
+        self.field = field
+        self.trie = field.trie
+        self.length = 0
+        # -1 right after a backslash, then the hex digits left of a \u escape
+        self.escape = 0
+        self.text = ""
+
+    def __call__(self, kind: str, delta: str) -> bool:
+        if kind != STRING:
+            # e.g. the null of a nullable string
             return True
+        field = self.field
+        if self.trie is not None:
+            node = self.trie
+            for char in delta:
+                node = node.get(char)
+                if node is None:
+                    return False
+            self.trie = node
 
-        return val in self.schema["enum"]
+        if field.max_length is not None:
+            for char in delta:
+                if self.escape == -1:
+                    self.escape = 4 if char == "u" else 0
+                elif self.escape:
+                    self.escape -= 1
+                else:
+                    if char == "\\":
+                        self.escape = -1
+                    self.length += 1
+            if self.length > field.max_length:
+                return False
 
-    def get_value(self, stream: str) -> str | None:
-        if len(stream) < 2:
+        if field.template or field.partial_pattern is not None:
+            if self.text is None:
+                return True
+            self.text += delta
+            if "\\" in self.text:
+                # Escapes would need decoding first; leave it to the final check
+                self.text = None
+                return True
+            if not matches_template(self.text, field.template):
+                return False
+            if field.partial_pattern is not None:
+                return field.partial_pattern.search(self.text, partial=True) is not None
+            if len(self.text) > len(field.template):
+                # Past the fixed-width start; the rest is checked at the end
+                self.text = None
+        return True
+
+
+def matches_template(text: str, template: str) -> bool:
+    if template.endswith("$") and len(text) > len(template) - 1:
+        return False
+    for char, expected in zip(text, template):
+        if expected == "d":
+            if not char.isdigit():
+                return False
+        elif expected not in "?$" and char != expected:
+            return False
+    return True
+
+
+class StrField(BaseField):
+    def __init__(self, schema: dict):
+        super().__init__(schema)
+        self.trie = build_trie(schema["enum"]) if "enum" in schema else None
+        self.max_length = schema.get("maxLength")
+        self.pattern = re.compile(schema["pattern"]) if "pattern" in schema else None
+        # Only an anchored pattern can rule out a prefix
+        self.partial_pattern = None
+        if regex is not None and schema.get("pattern", "").startswith("^"):
+            self.partial_pattern = regex.compile(schema["pattern"])
+        self.format = FORMATS.get(schema.get("format"))
+        self.template = FORMAT_TEMPLATES.get(schema.get("format"), "")
+
+    def accepts(self, kind: str, value) -> bool:
+        return kind == STRING
+
+    def prefix_check(self) -> StringPrefixCheck | None:
+        if self.trie is None and self.max_length is None and not (
+            self.template or self.partial_pattern
+        ):
             return None
+        return StringPrefixCheck(self)
 
-        if stream[0] == '"' and '"' in stream[1:]:
-            return stream.split('"')[1]
+    def token_text(self, text: str, value) -> str:
+        # Validated and returned decoded, escapes and all
+        return value
 
-        return None
+    def validate_value(self, val: str) -> str:
+        if "enum" in self.schema and val not in self.schema["enum"]:
+            return False
+        if "maxLength" in self.schema and len(val) > self.schema["maxLength"]:
+            return False
+        if "minLength" in self.schema and len(val) < self.schema["minLength"]:
+            return False
+        if self.pattern is not None and not self.pattern.search(val):
+            return False
+        if self.format is not None and not self.format.fullmatch(val):
+            return False
+        return True
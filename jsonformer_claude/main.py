@@ -1,41 +1,146 @@
+import dataclasses
+import os
 import re
+import time
 import anthropic
-from typing import List, Union, Dict, Any
-from jsonformer_claude.fields.base import FieldResponse
-from jsonformer_claude.fields.bool import BoolField
-from jsonformer_claude.fields.integer import IntField
-from jsonformer_claude.fields.string import StrField
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Tuple, Union
+from jsonformer_claude import events
+from jsonformer_claude.backends import (
+    CompletionBackend,
+    HedgedBackend,
+    HedgedStream,
+    as_backend,
+)
+from jsonformer_claude.budget import DEADLINE, Budget, BudgetExhausted
+from jsonformer_claude.cache import ResponseCache
+from jsonformer_claude.events import FieldEvent, json_pointer
+from jsonformer_claude.metrics import (
+    INITIAL,
+    INVALID,
+    MISMATCH,
+    STREAM_END,
+    FieldRecord,
+    GenerationRecord,
+    Metrics,
+    RequestRecord,
+    schema_pointer,
+)
+from jsonformer_claude.progress import ArraySpan, ProgressBuffer
+from jsonformer_claude.render import JSON, SCHEMA_HEADERS, render_schema
+from jsonformer_claude.schema import (
+    KEY_FIELD,
+    ArrayNode,
+    DiscriminatorNode,
+    Node,
+    NullableNode,
+    ObjectNode,
+    Property,
+    RefNode,
+    ScalarNode,
+    SchemaPlan,
+    compile_schema,
+    is_container,
+    property_groups,
+)
+from jsonformer_claude.speculation import Diverged, DocumentReader
+from jsonformer_claude.stream import StreamBuffer
+from jsonformer_claude.trace import ACCEPT, CHUNK, CLOSE, PREFIX, RESULT, Trace
 from termcolor import cprint
 import json
 
-FIELDS = {
-    "number": IntField,
-    "boolean": BoolField,
-    "string": StrField
-}
-
-
 class JsonformerClaude:
-    value: Dict[str, Any] = {}
-    last_anthropic_response: str | None = None
+    value: Dict[str, Any]
+    progress: ProgressBuffer
+    verified_length = 0
+    last_anthropic_response: StreamBuffer | None = None
     last_anthropic_response_finished: bool = False
     last_anthropic_stream = None
+    last_prompt: str | None = None
     llm_request_count = 0
+    abandoned_stream_count = 0
+    abandoned_stream_bytes = 0
+    retry_count = 0
+    hedges_fired = 0
+    hedges_won = 0
+    event_handler: Callable[[FieldEvent], None] | None = None
 
     def __init__(
         self,
-        anthropic_client: anthropic.Client,
-        json_schema: Dict[str, Any],
+        anthropic_client: Union[anthropic.Client, CompletionBackend],
+        json_schema: Union[Dict[str, Any], SchemaPlan],
         prompt: str,
         debug: bool = False,
+        speculative: bool = False,
+        cache: ResponseCache | None = None,
+        checkpoint_path: str | None = None,
+        checkpoint_interval: float = 1.0,
+        metrics: Metrics | None = None,
+        parallel: bool = False,
+        defaults: Dict[str, Any] | None = None,
+        array_window: int | None = None,
+        max_ref_depth: int | None = 8,
+        schema_format: str = JSON,
+        trace: Trace | None = None,
+        hedge_after: float | None = None,
+        deadline: float | None = None,
+        max_requests: int | None = None,
         **claude_args,
     ):
-        self.json_schema = json_schema
+        if isinstance(json_schema, SchemaPlan):
+            self.plan = json_schema
+        else:
+            self.plan = compile_schema(json_schema)
+        self.json_schema = self.plan.schema
         self.prompt = prompt
-        self.generation_marker = "|GENERATION|"
+        self.schema_format = schema_format
+        self.prompt_prefix = self.build_prompt_prefix(prompt)
         self.debug_on = debug
+        self.speculative = speculative
+        self.cache = cache
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint = 0.0
+        self.metrics = metrics
+        self.parallel = parallel
+        # JSON pointer, or schema pointer with "*" for array indices -> value
+        self.defaults = defaults or {}
+        # Finished items of each array kept in re-request prompts, None for all
+        self.array_window = array_window
+        # How often a ref may be nested in itself before its value is cut
+        # short, so recursive schemas always end; None for no limit
+        self.max_ref_depth = max_ref_depth
+        self.ref_depth: Dict[str, int] = {}
+        self.trace = trace
+        self.trace_id = 0
         self.anthropic_client = anthropic_client
+        self.backend = as_backend(anthropic_client)
+        if hedge_after is not None:
+            self.backend = HedgedBackend(self.backend, hedge_after)
+        # Seconds and completion requests a call may spend before the values
+        # still missing are filled in without Claude
+        self.budget: Budget | None = None
+        if deadline is not None or max_requests is not None:
+            self.budget = Budget(deadline, max_requests)
+        # JSON pointers of the values filled in or cut short for lack of budget
+        self.incomplete: List[str] = []
         self.claude_args = claude_args
+        # Per engine, as forks and concurrent calls each build their own
+        self.value = {}
+        self.progress = ProgressBuffer()
+        self.path: List[Union[str, int]] = []
+
+    def build_prompt_prefix(self, prompt: str) -> str:
+        template = """{HUMAN}{prompt}\n{header}\n{schema}{AI}"""
+        # Rendered first, as it is what rejects an unknown format
+        schema = render_schema(self.plan, self.schema_format)
+        return template.format(
+            prompt=prompt,
+            header=SCHEMA_HEADERS[self.schema_format],
+            schema=schema,
+            HUMAN=anthropic.HUMAN_PROMPT,
+            AI=anthropic.AI_PROMPT,
+        )
 
     def debug(self, caller: str, value: str, is_prompt: bool = False):
         if self.debug_on:
@@ -47,271 +152,961 @@ class JsonformerClaude:
                 cprint(caller, "green", end=" ")
                 cprint(value, "blue")
 
-    async def _completion(self, prompt: str):
+    async def _completion(self, prompt: str, buffer: StreamBuffer, reason: str):
+        cached = None if self.cache is None else self.cache.get_completion(prompt)
+        if cached is None and self.budget is not None:
+            # Replaying a cached completion is free
+            self.budget.charge()
+
+        request = 0
+        if self.trace is not None:
+            request = self.trace.request(self.trace_id, prompt, reason, json_pointer(self.path))
+
+        if cached is not None:
+            self.debug("[completion] replaying cached completion", prompt)
+            if self.trace is not None:
+                self.trace.record(self.trace_id, CHUNK, request, cached)
+                self.trace.record(self.trace_id, CLOSE, request, True)
+            buffer.feed(cached)
+            buffer.finished = True
+            if buffer is self.last_anthropic_response:
+                self.last_anthropic_response_finished = True
+            yield buffer
+            return
+
         self.debug("[completion] hitting anthropic", prompt)
-        self.last_anthropic_response_finished = False
-        stream = await self.anthropic_client.acompletion_stream(
-            prompt=prompt,
-            stop_sequences=[anthropic.HUMAN_PROMPT],
-            **self.claude_args,
+        path = list(self.path)
+        requested = time.perf_counter()
+        first_chunk = None
+        stream = await self.backend.start(
+            prompt, stop_sequences=[anthropic.HUMAN_PROMPT], **self.claude_args
         )
         self.llm_request_count += 1
-        async for response in stream:
-            self.last_anthropic_response = prompt + response["completion"]
-            assistant_index = self.last_anthropic_response.find(anthropic.AI_PROMPT)
-            if assistant_index > -1:
-                self.last_anthropic_response = self.strip_json_spaces(
-                    self.last_anthropic_response[
-                        assistant_index + len(anthropic.AI_PROMPT) :
-                    ]
+        deltas = []
+        streamed_bytes = 0
+        try:
+            async for delta in stream:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter()
+                deltas.append(delta)
+                streamed_bytes += len(delta.encode())
+                if self.trace is not None:
+                    self.trace.record(self.trace_id, CHUNK, request, delta)
+                buffer.feed(delta)
+                yield buffer
+            buffer.finished = True
+            if self.cache is not None:
+                self.cache.set_completion(prompt, "".join(deltas))
+            if buffer is self.last_anthropic_response:
+                self.last_anthropic_response_finished = True
+        finally:
+            if self.trace is not None:
+                self.trace.record(self.trace_id, CLOSE, request, buffer.finished)
+            discarded = 0
+            if not buffer.finished:
+                # Superseded, so stop Claude generating tokens nobody will read
+                discarded = max(len(buffer) - len(self.progress), 0)
+                self.abandoned_stream_count += 1
+                self.abandoned_stream_bytes += discarded
+                await stream.aclose()
+            if isinstance(stream, HedgedStream):
+                # Counted per stream, as the backend may serve other calls too
+                self.hedges_fired += stream.fired
+                self.hedges_won += stream.won
+            if self.metrics is not None:
+                self.metrics.record_request(
+                    RequestRecord(
+                        reason=reason,
+                        pointer=json_pointer(path),
+                        schema_pointer=schema_pointer(path),
+                        prompt_bytes=len(prompt.encode()),
+                        time_to_first_chunk=None
+                        if first_chunk is None
+                        else first_chunk - requested,
+                        streamed_bytes=streamed_bytes,
+                        discarded_bytes=discarded,
+                    )
                 )
-            yield self.last_anthropic_response
-        self.last_anthropic_response_finished = True
 
-    def completion(self, prompt: str):
-        self.last_anthropic_stream = self._completion(prompt)
+    async def close_stream(self):
+        """Closes the current stream and its connection if it is still open."""
+        if self.last_anthropic_stream is not None:
+            await self.last_anthropic_stream.aclose()
+
+    async def completion(self, prompt: str, reason: str = INITIAL):
+        self.cache_last_completion()
+        await self.close_stream()
+        # The prompt ends with the progress, so the completion continues from there
+        # and agrees with everything generated so far
+        self.verified_length = len(self.progress)
+        self.last_anthropic_response = StreamBuffer(start=len(self.progress))
+        self.last_anthropic_response_finished = False
+        self.last_prompt = prompt
+        self.last_anthropic_stream = self._completion(
+            prompt, self.last_anthropic_response, reason
+        )
         return self.last_anthropic_stream
 
-    async def prefix_matches(self, progress) -> bool:
+    async def wait_for_response(self, length: int) -> bool:
+        """
+        Waits until the current response is at least `length` long.
+
+        Returns False if the stream ends first.
+        """
+        while len(self.last_anthropic_response) < length:
+            try:
+                await self.next_chunk(self.last_anthropic_stream)
+            except StopAsyncIteration:
+                return False
+        return True
+
+    async def next_chunk(self, stream):
+        """
+        Reads the next chunk of `stream`, raising BudgetExhausted instead if the
+        deadline passes first.
+        """
+        remaining = None if self.budget is None else self.budget.remaining()
+        if remaining is None:
+            return await stream.__anext__()
+        if remaining <= 0:
+            self.budget.exhaust(DEADLINE)
+        try:
+            return await asyncio.wait_for(stream.__anext__(), remaining)
+        except asyncio.TimeoutError:
+            self.budget.exhaust(DEADLINE)
+
+    async def prefix_matches(self) -> bool:
         if self.last_anthropic_response is None:
             return False
+        progress = self.progress
         response = self.last_anthropic_response
-        assert (
-            len(progress) < len(response) or not self.last_anthropic_response_finished
-        )
-        while len(progress) >= len(response):
-            await self.last_anthropic_stream.__anext__()
-            response = self.last_anthropic_response
+        if not await self.wait_for_response(len(progress) + 1):
+            self.debug("[prefix_matches]", "stream ended before the progress")
+            return False
 
-        result = response.startswith(progress)
+        result = progress.matches(response, self.verified_length)
+        if self.trace is not None:
+            self.trace.record(self.trace_id, PREFIX, len(progress), result)
+        if result:
+            self.verified_length = len(progress)
 
         if not result:
             self.debug(
                 "[prefix_matches]",
                 f"Claude made a mistake",
             )
-
-            cprint(progress, "red")
-            cprint(response, "magenta")
+            self.debug("[prefix_matches] progress", progress)
+            self.debug("[prefix_matches] response", response)
 
         self.debug("[prefix_matches]", result)
         return result
 
     async def generate_object(
-        self, properties: Dict[str, Any], obj: Dict[str, Any]
+        self, properties: Tuple[Property, ...], obj: Dict[str, Any]
     ) -> Dict[str, Any]:
-        for key, schema in properties.items():
-            self.debug("[generate_object] generating value for", key)
-            obj[key] = await self.generate_value(schema, obj, key)
+        self.emit(events.START_OBJECT)
+        self.progress.append("{")
+        await self.generate_properties(properties, obj)
+        self.progress.append("}")
+        self.emit(events.END_OBJECT)
         return obj
 
-    def validate_ref(self, ref):
-        if not ref.startswith('#/'):
-            raise ValueError("Ref must start with #/")
+    async def generate_properties(
+        self, properties: Tuple[Property, ...], obj: Dict[str, Any]
+    ):
+        # Skip what is already written, e.g. the property a discriminator
+        # dispatched on
+        properties = [prop for prop in properties if prop.key not in obj]
+        if not all(prop.required for prop in properties):
+            return await self.generate_optional_properties(properties, obj)
+        if self.parallel:
+            groups = property_groups(properties)
+            if sum(is_container(group[-1].node) for group in groups) > 1:
+                return await self.generate_properties_concurrently(groups, obj)
 
-    def get_definition_by_ref(self, ref) -> dict:
-        self.validate_ref(ref)
+        for prop in properties:
+            if obj:
+                self.progress.append(",")
+            self.progress.append(prop.prefix)
+            self.debug("[generate_object] generating value for", prop.key)
+            self.path.append(prop.key)
+            obj[prop.key] = await self.generate_value(prop.node, obj, prop.key)
+            self.path.pop()
 
-        locations = ref.split('/')[1:]
-        definition = self.json_schema
-        for location in locations:
-            definition = definition.get(location)
+    async def generate_optional_properties(
+        self, properties: List[Property], obj: Dict[str, Any]
+    ):
+        """
+        Generates the properties Claude writes, in the order it writes them,
+        until it closes the object. Claude may leave out the optional ones, but
+        not the required ones.
+        """
+        remaining = list(properties)
+        while remaining:
+            prop = await self.next_property(remaining, after_member=bool(obj))
+            if prop is None:
+                break
+            remaining.remove(prop)
+            if obj:
+                self.progress.append(",")
+            self.progress.append(prop.prefix)
+            self.debug("[generate_object] generating value for", prop.key)
+            self.path.append(prop.key)
+            obj[prop.key] = await self.generate_value(prop.node, obj, prop.key)
+            self.path.pop()
 
-            if not definition:
-                raise ValueError("Improper reference")
+    async def next_property(
+        self, remaining: List[Property], after_member: bool
+    ) -> Property | None:
+        """
+        The property of `remaining` the response has next, or None where it
+        closes the object. A key that isn't one of them is re-requested. Where
+        the response doesn't say, e.g. it ended or closes the object early, the
+        first required property left is written and the next read re-requests.
+        """
+        fallback = next((prop for prop in remaining if prop.required), None)
+        retries = 0
+        while True:
+            try:
+                await self.get_stream()
+                response = self.last_anthropic_response
+                position = len(self.progress)
+                if not await self.wait_for_response(position + 1):
+                    return fallback
+                if response[position] == "}":
+                    return fallback
+                key = None
+                if not after_member or response[position] == ",":
+                    key = await self.read_key(position + 1 if after_member else position)
+            except BudgetExhausted:
+                return fallback
+            prop = next((prop for prop in remaining if prop.key == key), None)
+            if prop is not None:
+                return prop
+            if retries > 5:
+                return fallback
+            self.debug("[generate_object] unexpected key, retrying", key)
+            retries += 1
+            self.retry_count += 1
+            await self.completion(self.get_prompt(), reason=INVALID)
 
-        return definition
+    async def read_key(self, position: int) -> str | None:
+        """The object key the response has at `position`, if it has one."""
+        response = self.last_anthropic_response
+        parser = KEY_FIELD.parser()
+        while True:
+            text = response.slice(position)
+            position += len(text)
+            field_return = parser.feed(text)
+            if field_return.value_found:
+                return field_return.value if field_return.value_valid else None
+            try:
+                await self.next_chunk(self.last_anthropic_stream)
+            except StopAsyncIteration:
+                return None
 
-    async def get_stream(self):
-        progress = self.get_progress()
-        prompt = self.get_prompt()
+    async def next_is_null(self) -> bool:
+        """Whether the response has null where the next value goes."""
+        await self.get_stream()
+        response = self.last_anthropic_response
+        position = len(self.progress)
+        if not await self.wait_for_response(position + 1) or response[position] != "n":
+            return False
+        return (
+            await self.wait_for_response(position + 4)
+            and response.slice(position, position + 4) == "null"
+        )
+
+    async def generate_properties_concurrently(
+        self, groups: List[List[Property]], obj: Dict[str, Any]
+    ):
+        """
+        Generates the first group of properties on this engine while a fork per
+        remaining group generates it from the same prefix, then appends the
+        forks' text and values in schema order.
+        """
+        seed = self.get_progress() + ("," if obj else "")
+        forks = [self.fork(seed) for _ in groups[1:]]
+        results = await self.join_forks(
+            [fork.generate_fork_properties(group) for fork, group in zip(forks, groups[1:])],
+            self.generate_properties(groups[0], obj),
+        )
+        for fork, (start, values) in zip(forks, results):
+            self.absorb(fork)
+            if obj:
+                self.progress.append(",")
+            self.append_fork_text(fork, start)
+            obj.update(values)
+        self.checkpoint()
+
+    def fork(self, seed: str, note: str = "") -> "JsonformerClaude":
+        """An engine that continues the progress `seed` on its own stream."""
+        child = JsonformerClaude(
+            anthropic_client=self.backend,
+            json_schema=self.plan,
+            prompt=self.prompt + note,
+            debug=self.debug_on,
+            cache=self.cache,
+            metrics=self.metrics,
+            parallel=self.parallel,
+            defaults=self.defaults,
+            array_window=self.array_window,
+            max_ref_depth=self.max_ref_depth,
+            schema_format=self.schema_format,
+            trace=self.trace,
+            **self.claude_args,
+        )
+        child.trace_id = self.trace_id
+        child.budget = self.budget
+        child.progress = ProgressBuffer(seed)
+        child.progress.arrays = [
+            dataclasses.replace(span, items=list(span.items))
+            for span in self.progress.arrays
+        ]
+        child.path = list(self.path)
+        child.ref_depth = dict(self.ref_depth)
+        child.event_handler = self.event_handler
+        return child
+
+    def append_fork_text(self, child: "JsonformerClaude", start: int):
+        """Appends what `child` generated from `start`, and the arrays in it."""
+        self.progress.adopt_arrays(child.progress, start)
+        self.progress.append(child.get_progress()[start:])
+
+    @property
+    def budget_exhausted(self) -> str | None:
+        """Why the last call ran out of budget, DEADLINE or REQUESTS, if it did."""
+        return None if self.budget is None else self.budget.exhausted
 
-        self.debug("[debug-progress]", progress)
-        self.debug("[debug-progress]", prompt)
+    def absorb(self, child: "JsonformerClaude"):
+        self.llm_request_count += child.llm_request_count
+        self.abandoned_stream_count += child.abandoned_stream_count
+        self.abandoned_stream_bytes += child.abandoned_stream_bytes
+        self.retry_count += child.retry_count
+        self.hedges_fired += child.hedges_fired
+        self.hedges_won += child.hedges_won
+        self.incomplete.extend(child.incomplete)
 
-        stream = self.last_anthropic_response
+    async def join_forks(self, forks: List[Awaitable[Any]], here: Awaitable[Any]) -> List[Any]:
+        """
+        Runs `here` alongside the forks and returns the forks' results. The first
+        to fail cancels the others straight away rather than once `here` is done.
+        """
+        tasks = [asyncio.ensure_future(task) for task in (here, *forks)]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                # Raises the failure that ended the wait early, if one did
+                task.result()
+            return [task.result() for task in tasks[1:]]
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
 
-        if not await self.prefix_matches(progress) or stream is None:
+    async def generate_fork_properties(
+        self, properties: List[Property]
+    ) -> Tuple[int, Dict[str, Any]]:
+        start = len(self.progress)
+        obj = {}
+        try:
+            await self.generate_properties(properties, obj)
+        finally:
+            await self.close_stream()
+        return start, obj
 
-            stream = self.completion(prompt)
+    async def generate_fork_item(self, item_node: Node) -> Tuple[int, Any]:
+        start = len(self.progress)
+        holder = [None]
+        try:
+            value = await self.generate_value(item_node, holder)
+        finally:
+            await self.close_stream()
+        return start, value
+
+    def attach(self, obj: Union[Dict[str, Any], List[Any]], key, value):
+        if type(obj) is list:
+            obj[-1] = value
         else:
-            stream = self.last_anthropic_stream
+            obj[key] = value
+
+    def emit(self, kind: str, value: Any = None):
+        if self.event_handler is not None:
+            self.event_handler(FieldEvent(kind, json_pointer(self.path), value))
+
+    async def get_stream(self):
+        self.debug("[debug-progress]", self.progress)
+
+        if self.last_anthropic_response is None:
+            return await self.completion(self.get_prompt())
+        if not await self.prefix_matches():
+            return await self.completion(self.get_prompt(), reason=MISMATCH)
+
+        return self.last_anthropic_stream
 
-        return stream
+    async def generate_scalar(self, node: ScalarNode, retries: int = 0) -> Any:
+        if retries > 5:
+            self.debug("[completion] EXCEEDED RETRIES RETURNING NONE", str(retries))
+            self.progress.append("null")
+            return None
+
+        field = node.field
+
+        stream = await self.get_stream()
+        response = self.last_anthropic_response
+        parser = field.parser()
+        position = len(self.progress)
+
+        while True:
+            # Read what is already buffered before waiting for more chunks, and
+            # only what the parser hasn't seen yet
+            completion = response.slice(position)
+            position += len(completion)
+            self.debug("[completion]", completion)
+            field_return = parser.feed(completion)
+            self.debug("[completion]", field_return)
+
+            if field_return.value_valid:
+                # The streamed text rather than a re-encoding of the value, so
+                # the progress keeps matching the response byte for byte
+                self.progress.append(field_return.text)
+                return field_return.value
+            elif field_return.value_found:
+                self.debug("[completion]", "retrying")
+                self.retry_count += 1
+                await self.completion(self.get_prompt(), reason=INVALID)
+                # Could do things like change temperature here
+                return await self.generate_scalar(node=node, retries=retries + 1)
+
+            try:
+                await self.next_chunk(stream)
+            except StopAsyncIteration:
+                # The stream ended mid-value, e.g. a resumed checkpoint that ends
+                # in a number, so ask for the value again
+                self.debug("[completion]", "stream ended, retrying")
+                self.retry_count += 1
+                await self.completion(self.get_prompt(), reason=STREAM_END)
+                return await self.generate_scalar(node=node, retries=retries + 1)
 
     async def generate_value(
         self,
-        schema: Dict[str, Any],
+        node: Node,
         obj: Union[Dict[str, Any], List[Any]],
         key: Union[str, None] = None,
-        retries: int = 0
     ) -> Any:
-        if retries > 5:
-            self.debug("[completion] EXCEEDED RETRIES RETURNING NONE", str(retries))
-            return None
+        if self.defaults and (pointer := self.default_pointer()) is not None:
+            return self.write_fixed(node, obj, key, self.defaults[pointer])
 
-        schema_type = schema.get("type")
+        if isinstance(node, ScalarNode) and node.fixed is not None:
+            return self.write_fixed(node, obj, key, json.loads(node.fixed), node.fixed)
 
-        if schema_type in FIELDS:
-            field = FIELDS[schema_type](
-                schema=schema,
-                obj=obj,
-                key=key,
-                generation_marker=self.generation_marker
-            )
-            field.insert_generation_marker()
-
-            stream = await self.get_stream()
-
-            async for completion in stream:
-                progress = self.get_progress()
-                completion = completion[len(progress):]
-                self.debug("[completion]", completion)
-                field_return = field.generate_value(completion)
-                self.debug("[completion]", field_return)
-
-                if field_return.value_valid:
-                    return field_return.value
-                elif field_return.value_found:
-                    self.debug("[completion]", "retrying")
-                    self.completion(self.get_prompt())
-                    # Could do things like change temperature here
-                    return await self.generate_value(
-                        schema=schema,
-                        obj=obj,
-                        key=key,
-                        retries=retries + 1
+        elif isinstance(node, ScalarNode):
+            started = time.perf_counter()
+            start = len(self.progress)
+            requests = self.llm_request_count
+            retries = self.retry_count
+            try:
+                value = await self.generate_scalar(node)
+            except BudgetExhausted:
+                return self.fill_incomplete(node, obj, key)
+            self.emit(events.VALUE, value)
+            if self.trace is not None:
+                self.trace.record(
+                    self.trace_id, ACCEPT, json_pointer(self.path), self.get_progress()[start:]
+                )
+            if self.metrics is not None:
+                self.metrics.record_field(
+                    FieldRecord(
+                        pointer=json_pointer(self.path),
+                        schema_pointer=schema_pointer(self.path),
+                        time_to_accept=time.perf_counter() - started,
+                        value_bytes=len(self.progress) - start,
+                        retries=self.retry_count - retries,
+                        requests=self.llm_request_count - requests,
                     )
+                )
+            self.checkpoint()
+            return value
 
-        elif schema_type == "array":
+        elif isinstance(node, ArrayNode):
+            if self.ref_exhausted(node.items):
+                return self.write_fixed(node, obj, key, [])
             new_array = []
-            obj[key] = new_array
-            return await self.generate_array(schema["items"], new_array)
+            self.attach(obj, key, new_array)
+            length = None
+            if node.schema.get("minItems") == node.schema.get("maxItems"):
+                length = node.schema.get("minItems")
+            return await self.generate_array(node.items, new_array, length)
 
-        elif schema_type == "object":
+        elif isinstance(node, ObjectNode):
             new_obj = {}
-            if key:
-                obj[key] = new_obj
-            else:
-                obj.append(new_obj)
-
-            return await self.generate_object(schema["properties"], new_obj)
-
-        elif discriminator := schema.get("discriminator"):
-            property_name = discriminator["propertyName"]
-            mapping = discriminator["mapping"]
-
-            property_name_schema = {
-                "type": "string",
-                "enum": [m for m in mapping]
-            }
+            self.attach(obj, key, new_obj)
+            return await self.generate_object(node.properties, new_obj)
 
+        elif isinstance(node, DiscriminatorNode):
             new_obj = {}
-            new_obj[property_name] = self.generation_marker
-
-            if key:
-                obj[key] = new_obj
-            else:
-                obj.append(new_obj)
+            self.attach(obj, key, new_obj)
+            self.emit(events.START_OBJECT)
+            self.progress.append(node.property.prefix)
 
+            self.path.append(node.property.key)
             property_enum_value = await self.generate_value(
-                schema=property_name_schema,
+                node=node.property.node,
                 obj=new_obj,
-                key=property_name
+                key=node.property.key
             )
-            new_obj[property_name] = property_enum_value
-
-            #new_obj.pop(property_name)
+            self.path.pop()
+            new_obj[node.property.key] = property_enum_value
 
             self.debug("[discriminator]", property_enum_value)
 
-            schema = self.get_definition_by_ref(mapping[property_enum_value])
-            self.debug("[discriminator]", schema)
-            return await self.generate_object(properties=schema["properties"], obj=new_obj)
+            if property_enum_value not in node.mapping:
+                # Filled in for lack of budget, so there are no properties to add
+                self.progress.append("}")
+                self.emit(events.END_OBJECT)
+                return new_obj
+            selected = node.mapping[property_enum_value]
+            while isinstance(selected, RefNode):
+                selected = selected.target
+            self.debug("[discriminator]", selected.schema)
+            await self.generate_properties(properties=selected.properties, obj=new_obj)
+            self.progress.append("}")
+            self.emit(events.END_OBJECT)
+            return new_obj
 
+        elif isinstance(node, NullableNode):
+            try:
+                is_null = await self.next_is_null()
+            except BudgetExhausted:
+                return self.fill_incomplete(node, obj, key)
+            if is_null:
+                return self.write_fixed(node, obj, key, None)
+            return await self.generate_value(node.node, obj, key)
 
-        elif ref := schema.get("$ref"):
-            definition = self.get_definition_by_ref(ref)
-            return await self.generate_value(
-                schema=definition,
-                obj=obj,
-                key=key,
-            )
+        elif isinstance(node, RefNode):
+            if self.ref_exhausted(node):
+                target = node.target
+                while isinstance(target, RefNode):
+                    target = target.target
+                return self.write_fixed(
+                    node, obj, key, [] if isinstance(target, ArrayNode) else None
+                )
+            depth = self.ref_depth.get(node.ref, 0)
+            self.ref_depth[node.ref] = depth + 1
+            try:
+                return await self.generate_value(
+                    node=node.target,
+                    obj=obj,
+                    key=key,
+                )
+            finally:
+                self.ref_depth[node.ref] = depth
 
         else:
-            raise ValueError(f"Unsupported schema type: {schema_type}")
+            raise ValueError(f"Unsupported schema node: {node}")
+
+    def ref_exhausted(self, node: Node) -> bool:
+        if self.max_ref_depth is None or not isinstance(node, RefNode):
+            return False
+        # The count includes the outermost occurrence, which isn't nested
+        if self.ref_depth.get(node.ref, 0) <= self.max_ref_depth:
+            return False
+        self.debug("[ref] depth limit reached, cutting off", node.ref)
+        return True
+
+    def fill_incomplete(
+        self, node: Node, obj: Union[Dict[str, Any], List[Any]], key: Union[str, None]
+    ) -> Any:
+        """Writes the schema's default, or null, for a value out of budget."""
+        self.debug("[budget] out of budget, filling in", json_pointer(self.path))
+        self.incomplete.append(json_pointer(self.path))
+        return self.write_fixed(node, obj, key, node.schema.get("default"))
+
+    def default_pointer(self) -> str | None:
+        for pointer in (json_pointer(self.path), schema_pointer(self.path)):
+            if pointer in self.defaults:
+                return pointer
+        return None
+
+    def write_fixed(
+        self,
+        node: Node,
+        obj: Union[Dict[str, Any], List[Any]],
+        key: Union[str, None],
+        value: Any,
+        text: str | None = None,
+    ) -> Any:
+        """
+        Writes a value the schema or the caller already decided without reading
+        the stream. If Claude wrote the same text the stream stays in step and
+        is read on from after it, otherwise the next read re-requests.
+        """
+        self.debug("[fixed]", value)
+        self.progress.append(json.dumps(value) if text is None else text)
+        self.attach(obj, key, value)
+        if self.event_handler is not None:
+            self.emit_tree(node, value)
+        self.checkpoint()
+        return value
 
     async def generate_array(
-        self, item_schema: Dict[str, Any], arr: List[Any]
+        self, item_node: Node, arr: List[Any], length: int | None = None
     ) -> List[Any]:
+        self.emit(events.START_ARRAY)
+        span = self.progress.open_array(json_pointer(self.path))
+        if self.parallel and length is not None and length > 1 and is_container(item_node):
+            await self.generate_items_concurrently(item_node, arr, length, span)
+            self.progress.close_array(span)
+            self.emit(events.END_ARRAY)
+            return arr
+
         while True:
-            if self.last_anthropic_response is None:
-                # todo: below is untested since we do not support top level arrays yet
-                stream = self.completion(self.get_prompt())
-                async for response in stream:
-                    completion = response[len(self.get_progress()) :]
-                    if completion and completion[0] == ",":
-                        self.last_anthropic_response = completion[1:]
-                        break
-            else:
-                arr.append(self.generation_marker)
-                progress = self.get_progress()
-                arr.pop()
-                progress = progress.rstrip(",")
-                response = self.last_anthropic_response
-                while len(progress) >= len(response):
-                    await self.last_anthropic_stream.__anext__()
-                    response = self.last_anthropic_response
-                next_char = response[len(progress)]
-                if next_char == "]":
-                    return arr
-
-            value = await self.generate_value(item_schema, arr)
+            progress = self.progress
+            try:
+                # Requests a completion if there is none yet or it diverged, e.g.
+                # in the key before the array
+                await self.get_stream()
+                if not await self.wait_for_response(len(progress) + 1):
+                    # The stream ended before saying whether the array goes on
+                    break
+            except BudgetExhausted:
+                # Closed with the items it has so far
+                self.debug("[budget] out of budget, closing", json_pointer(self.path))
+                self.incomplete.append(json_pointer(self.path))
+                break
+            next_char = self.last_anthropic_response[len(progress)]
+            if next_char == "]":
+                break
+
+            if arr:
+                self.progress.append(",")
+            span.items.append(len(self.progress))
+            arr.append(None)
+            self.path.append(len(arr) - 1)
+            value = await self.generate_value(item_node, arr)
+            self.path.pop()
             arr[-1] = value
 
-    def strip_json_spaces(self, json_string: str) -> str:
-        should_remove_spaces = True
+        self.progress.close_array(span)
+        self.emit(events.END_ARRAY)
+        return arr
 
-        def is_unescaped_quote(index):
-            return json_string[index] == '"' and (
-                index < 1 or json_string[index - 1] != "\\"
+    async def generate_items_concurrently(
+        self, item_node: Node, arr: List[Any], length: int, span: ArraySpan
+    ):
+        """
+        Generates the first item on this engine while a fork per remaining item
+        generates it from the same prefix, told which item it is producing.
+        """
+        seed = self.get_progress()
+        pointer = json_pointer(self.path) or "the root"
+        forks = []
+        for index in range(1, length):
+            fork = self.fork(
+                seed, note=f"\nOnly output item {index + 1} of the {length} items of {pointer}."
             )
+            fork.path.append(index)
+            forks.append(fork)
 
-        index = 0
-        while index < len(json_string):
-            if is_unescaped_quote(index):
-                should_remove_spaces = not should_remove_spaces
-            elif json_string[index] in [" ", "\t", "\n"] and should_remove_spaces:
-                json_string = json_string[:index] + json_string[index + 1 :]
-                continue
-            index += 1
-        return json_string
+        async def generate_first():
+            span.items.append(len(self.progress))
+            arr.append(None)
+            self.path.append(0)
+            arr[0] = await self.generate_value(item_node, arr)
+            self.path.pop()
+
+        results = await self.join_forks(
+            [fork.generate_fork_item(item_node) for fork in forks], generate_first()
+        )
+        for fork, (start, value) in zip(forks, results):
+            self.absorb(fork)
+            self.progress.append(",")
+            span.items.append(len(self.progress))
+            self.append_fork_text(fork, start)
+            arr.append(value)
+        self.checkpoint()
+
+    def strip_json_spaces(self, json_string: str) -> str:
+        buffer = StreamBuffer()
+        buffer.feed(json_string)
+        return str(buffer)
 
     def get_progress(self):
-        progress = json.dumps(self.value, separators=(",", ":"))
-        gen_marker_index = progress.find(f'"{self.generation_marker}"')
-        if gen_marker_index != -1:
-            progress = progress[:gen_marker_index]
-        else:
-            raise ValueError("Failed to find generation marker")
-        return self.strip_json_spaces(progress)
+        return self.progress.getvalue()
 
     def get_prompt(self):
-        template = """{HUMAN}{prompt}\nOutput result in the following JSON schema format:\n{schema}{AI}{progress}"""
-        progress = self.get_progress()
-        prompt = template.format(
-            prompt=self.prompt,
-            schema=json.dumps(self.json_schema),
-            progress=progress,
-            HUMAN=anthropic.HUMAN_PROMPT,
-            AI=anthropic.AI_PROMPT,
+        if self.array_window is not None:
+            progress, omitted = self.progress.windowed(self.array_window)
+            if omitted:
+                # Long arrays are cut down to their last items, so re-requests
+                # late in a long output stay small; the value is kept whole here
+                notes = "".join(
+                    f"\nThe first {count} items of {pointer} are left out of the output below."
+                    for pointer, count in omitted
+                )
+                return (self.build_prompt_prefix(self.prompt + notes) + progress).rstrip()
+        return (self.prompt_prefix + self.get_progress()).rstrip()
+
+    async def speculate(self) -> Dict[str, Any] | None:
+        """
+        Requests the first completion and checks it against the schema as it
+        streams, accepting it in one go once Claude closes the document.
+
+        Returns None at the first token the field-by-field generation wouldn't
+        accept, without waiting for the rest of the document; the buffered
+        response is kept, so that generation replays it and only re-requests
+        from the point of divergence.
+        """
+        root = self.plan.root
+        self.progress.append("{")
+        # Only where generate_properties writes the first key itself too, so a
+        # fallback rewrites the progress the response was requested from
+        if root.properties and all(prop.required for prop in root.properties):
+            self.progress.append(root.properties[0].prefix)
+
+        prefix = self.get_progress()
+        stream = await self.completion(self.get_prompt())
+        response = self.last_anthropic_response
+        reader = DocumentReader(
+            prefix,
+            response,
+            lambda: self.next_chunk(stream),
+            defaults=self.defaults,
+            max_ref_depth=self.max_ref_depth,
         )
-        return prompt.rstrip()
+        try:
+            value = await reader.read_value(root)
+        except BudgetExhausted:
+            return None
+        except Diverged as e:
+            self.debug("[speculate] falling back to field generation", str(e))
+            return None
+
+        self.debug("[speculate]", "accepted the first completion")
+        self.progress.append(response.slice(response.start, reader.position))
+        self.verified_length = len(self.progress)
+        if self.event_handler is not None:
+            self.emit_tree(root, value)
+        return value
+
+    def emit_tree(self, node: Node, value: Any):
+        """Emits the events a field-by-field generation of `value` would have."""
+        while isinstance(node, (RefNode, NullableNode)):
+            node = node.target if isinstance(node, RefNode) else node.node
+
+        if isinstance(node, ScalarNode) or value is None:
+            # A null in place of an object is a ref cut off at its depth limit
+            self.emit(events.VALUE, value)
+        elif isinstance(node, ArrayNode):
+            self.emit(events.START_ARRAY)
+            for index, item in enumerate(value):
+                self.path.append(index)
+                self.emit_tree(node.items, item)
+                self.path.pop()
+            self.emit(events.END_ARRAY)
+        else:
+            if isinstance(node, DiscriminatorNode):
+                selected = node.mapping.get(value[node.property.key])
+                while isinstance(selected, RefNode):
+                    selected = selected.target
+                properties = (node.property,) + (selected.properties if selected else ())
+            else:
+                properties = node.properties
+            nodes = {}
+            for prop in properties:
+                # The discriminator property may repeat in the selected object
+                nodes.setdefault(prop.key, prop.node)
+            self.emit(events.START_OBJECT)
+            # In the order they were written, which optional properties can change
+            for key, item in value.items():
+                self.path.append(key)
+                self.emit_tree(nodes[key], item)
+                self.path.pop()
+            self.emit(events.END_OBJECT)
 
     async def __call__(self) -> Dict[str, Any]:
         self.llm_request_count = 0
+        self.abandoned_stream_count = 0
+        self.abandoned_stream_bytes = 0
+        self.retry_count = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        if self.budget is not None:
+            self.budget.start()
+        self.incomplete = []
         self.value = {}
-        generated_data = await self.generate_object(
-            self.json_schema["properties"], self.value
+        self.progress = ProgressBuffer()
+        self.verified_length = 0
+        self.path = []
+
+        if self.trace is not None:
+            self.trace_id = self.trace.begin(
+                prompt=self.prompt,
+                schema=self.json_schema,
+                claude_args=self.claude_args,
+                speculative=self.speculative,
+                parallel=self.parallel,
+                defaults=self.defaults,
+                array_window=self.array_window,
+                max_ref_depth=self.max_ref_depth,
+                schema_format=self.schema_format,
+                deadline=None if self.budget is None else self.budget.deadline,
+                max_requests=None if self.budget is None else self.budget.max_requests,
+            )
+
+        started = time.perf_counter()
+        try:
+            if self.cache is None:
+                value = await self.generate()
+            else:
+                key = self.checkpoint_key()
+                value = await self.cache.get_or_create(key, self.generate)
+                if self.incomplete:
+                    # Partial, so a later call should try again for the whole value
+                    self.cache.delete(key)
+                if value is not self.value:
+                    self.debug("[cache]", "reusing a cached generation")
+                    self.value = value
+                    if self.event_handler is not None:
+                        self.emit_tree(self.plan.root, value)
+        except BaseException as e:
+            if self.trace is not None:
+                self.trace.record(self.trace_id, RESULT, None, f"{type(e).__name__}: {e}")
+                self.trace.flush()
+            raise
+        if self.trace is not None:
+            self.trace.record(self.trace_id, RESULT, value, None)
+            self.trace.flush()
+
+        if self.metrics is not None:
+            self.metrics.record_generation(
+                GenerationRecord(
+                    elapsed=time.perf_counter() - started,
+                    requests=self.llm_request_count,
+                    output_bytes=len(self.progress),
+                    discarded_bytes=self.abandoned_stream_bytes,
+                    hedges_fired=self.hedges_fired,
+                    hedges_won=self.hedges_won,
+                    incomplete=len(self.incomplete),
+                )
+            )
+        return value
+
+    def cache_last_completion(self):
+        response = self.last_anthropic_response
+        if self.cache is None or response is None or response.finished:
+            return
+        # Called when the engine is done with the stream, either because it is
+        # superseded or because the document is complete, so the text received
+        # so far is all a replay of this prompt needs
+        self.cache.set_completion(self.last_prompt, str(response))
+
+    def checkpoint_key(self) -> str:
+        """Identifies the value a call generates, for the cache and checkpoints."""
+        return ResponseCache.key(
+            self.prompt,
+            self.plan,
+            self.claude_args,
+            defaults=self.defaults,
+            max_ref_depth=self.max_ref_depth,
         )
-        return generated_data
+
+    def checkpoint(self, force: bool = False):
+        """
+        Saves the progress and the partial value to `checkpoint_path`, at most
+        once every `checkpoint_interval` seconds unless forced.
+        """
+        if self.checkpoint_path is None:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_checkpoint < self.checkpoint_interval:
+            return
+        self.last_checkpoint = now
+
+        # Written next to the checkpoint and renamed, so a crash mid-write
+        # leaves the previous checkpoint intact
+        temporary_path = self.checkpoint_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(
+                {
+                    "key": self.checkpoint_key(),
+                    "progress": self.get_progress(),
+                    "value": self.value,
+                },
+                f,
+            )
+        os.replace(temporary_path, self.checkpoint_path)
+
+    def resume(self) -> bool:
+        """
+        Loads the progress saved at `checkpoint_path` as if Claude had already
+        streamed it. The generation replays it locally and only requests a
+        completion, prompted with the saved prefix, once it runs past the end.
+        """
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return False
+        with open(self.checkpoint_path) as f:
+            saved = json.load(f)
+        if saved.get("key") != self.checkpoint_key():
+            self.debug("[resume]", "ignoring a checkpoint of a different generation")
+            return False
+
+        self.debug("[resume]", saved["progress"])
+        self.last_anthropic_response = StreamBuffer()
+        self.last_anthropic_response.feed(saved["progress"])
+        self.last_anthropic_stream = self._replay(self.last_anthropic_response)
+        return True
+
+    async def _replay(self, buffer: StreamBuffer):
+        # Everything is already buffered, so the stream ends straight away
+        buffer.finished = True
+        return
+        yield buffer
+
+    async def generate(self) -> Dict[str, Any]:
+        try:
+            if not self.resume() and self.speculative:
+                value = await self.speculate()
+                if value is not None:
+                    self.value = value
+                    self.cache_last_completion()
+                    return value
+                # Start over locally; the buffered response is replayed
+                self.progress = ProgressBuffer()
+                self.verified_length = min(
+                    self.verified_length, self.last_anthropic_response.start
+                )
+
+            generated_data = await self.generate_object(
+                self.plan.root.properties, self.value
+            )
+            self.cache_last_completion()
+            if self.checkpoint_path is not None and os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            return generated_data
+        except BaseException:
+            self.checkpoint(force=True)
+            raise
+        finally:
+            await self.close_stream()
+
+    async def stream_events(self) -> AsyncIterator[FieldEvent]:
+        """
+        Runs the generation, yielding a FieldEvent as each scalar is accepted and
+        as objects and arrays open and close. The finished object is left in
+        `self.value`; a failed generation re-raises once its events are drained.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        self.event_handler = queue.put_nowait
+        generation = asyncio.create_task(self())
+        generation.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+            await generation
+        finally:
+            self.event_handler = None
+            if not generation.done():
+                generation.cancel()
+                await asyncio.gather(generation, return_exceptions=True)
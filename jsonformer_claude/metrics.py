@@ -0,0 +1,169 @@
+import math
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Sequence, Union
+
+INITIAL = "initial"
+MISMATCH = "mismatch"
+INVALID = "invalid"
+STREAM_END = "stream_end"
+
+
+@dataclass(frozen=True)
+class RequestRecord:
+    # Why the completion was requested: INITIAL, MISMATCH, INVALID or STREAM_END
+    reason: str
+    # JSON pointer of the value being generated, and the same with array
+    # indices replaced by "*" so items of one array aggregate together
+    pointer: str
+    schema_pointer: str
+    prompt_bytes: int
+    time_to_first_chunk: float | None
+    streamed_bytes: int
+    # Received past the point the engine accepted before the stream was dropped
+    discarded_bytes: int
+
+
+@dataclass(frozen=True)
+class FieldRecord:
+    pointer: str
+    schema_pointer: str
+    time_to_accept: float
+    value_bytes: int
+    retries: int
+    requests: int
+
+
+@dataclass(frozen=True)
+class GenerationRecord:
+    elapsed: float
+    requests: int
+    output_bytes: int
+    discarded_bytes: int
+    hedges_fired: int = 0
+    hedges_won: int = 0
+    # Values filled in or arrays cut short when the budget ran out
+    incomplete: int = 0
+
+
+class Metrics:
+    """
+    Receives a record for every completion request, every accepted scalar and
+    every finished generation. Subclass it and override the hooks you need.
+    """
+
+    def record_request(self, record: RequestRecord):
+        pass
+
+    def record_field(self, record: FieldRecord):
+        pass
+
+    def record_generation(self, record: GenerationRecord):
+        pass
+
+
+def schema_pointer(path: Iterable[Union[str, int]]) -> str:
+    return "".join(
+        "/*" if type(part) is int else "/" + part.replace("~", "~0").replace("/", "~1")
+        for part in path
+    )
+
+
+def percentiles(
+    values: Sequence[float], quantiles: Sequence[float] = (50, 90, 99)
+) -> Dict[str, float]:
+    """Nearest-rank percentiles of `values`, plus their count, mean and max."""
+    ordered = sorted(values)
+    if not ordered:
+        return {"count": 0}
+    summary = {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "max": ordered[-1],
+    }
+    for q in quantiles:
+        rank = max(math.ceil(q / 100 * len(ordered)), 1)
+        summary[f"p{q:g}"] = ordered[rank - 1]
+    return summary
+
+
+class MetricsAggregator(Metrics):
+    """
+    Keeps every record and summarizes them per schema path, per request reason
+    and per generation. Can be shared by many generations, e.g. a batch.
+    """
+
+    def __init__(self, quantiles: Sequence[float] = (50, 90, 99)):
+        self.quantiles = quantiles
+        self.requests: List[RequestRecord] = []
+        self.fields: List[FieldRecord] = []
+        self.generations: List[GenerationRecord] = []
+
+    def record_request(self, record: RequestRecord):
+        self.requests.append(record)
+
+    def record_field(self, record: FieldRecord):
+        self.fields.append(record)
+
+    def record_generation(self, record: GenerationRecord):
+        self.generations.append(record)
+
+    def summarize(self, records: list, attributes: Sequence[str]) -> Dict[str, Dict[str, float]]:
+        return {
+            attribute: percentiles(
+                [
+                    getattr(record, attribute)
+                    for record in records
+                    if getattr(record, attribute) is not None
+                ],
+                self.quantiles,
+            )
+            for attribute in attributes
+        }
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, Dict[str, float]]]]:
+        fields = defaultdict(list)
+        for record in self.fields:
+            fields[record.schema_pointer].append(record)
+        requests_by_path = defaultdict(list)
+        requests_by_reason = defaultdict(list)
+        for record in self.requests:
+            requests_by_path[record.schema_pointer].append(record)
+            requests_by_reason[record.reason].append(record)
+
+        request_attributes = (
+            "prompt_bytes",
+            "time_to_first_chunk",
+            "streamed_bytes",
+            "discarded_bytes",
+        )
+        return {
+            "fields": {
+                pointer: self.summarize(
+                    records, ("time_to_accept", "value_bytes", "retries", "requests")
+                )
+                for pointer, records in fields.items()
+            },
+            "requests_by_path": {
+                pointer: self.summarize(records, request_attributes)
+                for pointer, records in requests_by_path.items()
+            },
+            "requests_by_reason": {
+                reason: self.summarize(records, request_attributes)
+                for reason, records in requests_by_reason.items()
+            },
+            "generations": {
+                "all": self.summarize(
+                    self.generations,
+                    (
+                        "elapsed",
+                        "requests",
+                        "output_bytes",
+                        "discarded_bytes",
+                        "hedges_fired",
+                        "hedges_won",
+                        "incomplete",
+                    ),
+                )
+            },
+        }
@@ -0,0 +1,439 @@
+import asyncio
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Sequence, Tuple, Union
+
+import anthropic
+
+from jsonformer_claude.events import json_pointer
+from jsonformer_claude.schema import (
+    ArrayNode,
+    DiscriminatorNode,
+    Node,
+    NullableNode,
+    ObjectNode,
+    RefNode,
+    ScalarNode,
+    SchemaPlan,
+    compile_schema,
+)
+
+WORDS = [
+    "red", "classic", "engine", "river", "green", "light", "harbor", "silver",
+    "party", "summer", "north", "garden", "quiet", "motor", "city", "bright",
+]
+
+# The note a forked completion's prompt carries when it generates a single item
+ITEM_NOTE = re.compile(r"Only output item (\d+) of the \d+ items of (.*)\.$", re.M)
+# The note a windowed re-request carries for the items it leaves out
+WINDOW_NOTE = re.compile(r"The first (\d+) items of (.*) are left out of the output below\.$", re.M)
+
+
+@dataclass
+class Mistake:
+    """A span of the target document that can be replaced by something wrong."""
+
+    start: int
+    end: int
+    replacement: str
+
+
+@dataclass
+class Span:
+    """Where a value of the sampled document starts and ends, and its children."""
+
+    start: int
+    end: int = 0
+    # (key, position of the key, value) for objects, in document order
+    members: List[Tuple[str, int, "Span"]] | None = None
+    items: List["Span"] | None = None
+
+
+class DocumentSampler:
+    """
+    Builds a schema-conforming document, serialized exactly the way the engine
+    writes its progress, and remembers where mistakes can be injected.
+    """
+
+    def __init__(
+        self,
+        rng: random.Random,
+        array_length: int = 3,
+        string_words: int = 3,
+        max_depth: int = 4,
+        omit_rate: float = 0.3,
+    ):
+        self.rng = rng
+        self.array_length = array_length
+        self.string_words = string_words
+        self.max_depth = max_depth
+        # How often an optional property is left out and a nullable value null
+        self.omit_rate = omit_rate
+        self.parts: List[str] = []
+        self.length = 0
+        self.mistakes: List[Mistake] = []
+
+    def write(self, text: str, mistake: str | None = None):
+        if mistake is not None:
+            self.mistakes.append(Mistake(self.length, self.length + len(text), mistake))
+        self.parts.append(text)
+        self.length += len(text)
+
+    def scalar(self, node: ScalarNode):
+        schema = node.schema
+        schema_type = schema.get("type")
+        if schema.get("nullable") is True and self.rng.random() < self.omit_rate:
+            self.write("null")
+        elif "const" in schema:
+            self.write(json.dumps(schema["const"]))
+        elif "enum" in schema:
+            self.write(json.dumps(self.rng.choice(schema["enum"])), mistake='"not-in-enum"')
+        elif schema_type == "number":
+            low = schema.get("min", 0)
+            high = schema.get("max", low + 1000)
+            self.write(json.dumps(self.rng.randint(int(low), int(high))), mistake="abc")
+        elif schema_type == "boolean":
+            self.write(json.dumps(self.rng.random() < 0.5), mistake="maybe")
+        elif schema.get("format") == "email":
+            words = self.rng.choices(WORDS, k=3)
+            self.write('"%s.%s@%s.com"' % tuple(words))
+        elif schema.get("format") == "date":
+            self.write('"20%02d-%02d-%02d"' % (
+                self.rng.randint(0, 23), self.rng.randint(1, 12), self.rng.randint(1, 28)
+            ))
+        else:
+            words = self.rng.choices(WORDS, k=self.string_words)
+            self.write(json.dumps(" ".join(words)))
+
+    def properties(
+        self,
+        node: ObjectNode,
+        depth: int,
+        span: Span,
+        skip: str | None = None,
+        first: bool = True,
+    ):
+        for prop in node.properties:
+            if prop.key == skip:
+                continue
+            if not prop.required and self.rng.random() < self.omit_rate:
+                continue
+            if not first:
+                self.write(",")
+            first = False
+            key_start = self.length
+            self.write(prop.prefix, mistake=prop.prefix[:-2] + 'x":')
+            span.members.append((prop.key, key_start, self.value(prop.node, depth + 1)))
+
+    def value(self, node: Node, depth: int = 0) -> Span:
+        span = Span(start=self.length)
+        while isinstance(node, (RefNode, NullableNode)):
+            if isinstance(node, RefNode):
+                node = node.target
+            elif self.rng.random() < self.omit_rate:
+                node = None
+            else:
+                node = node.node
+
+        if node is None:
+            self.write("null")
+        elif isinstance(node, ScalarNode):
+            self.scalar(node)
+        elif isinstance(node, ArrayNode):
+            span.items = []
+            self.write("[")
+            length = self.array_length if depth < self.max_depth else 0
+            if node.schema.get("minItems") is not None and (
+                node.schema.get("minItems") == node.schema.get("maxItems")
+            ):
+                length = node.schema["minItems"]
+            for index in range(length):
+                if index:
+                    self.write(",")
+                span.items.append(self.value(node.items, depth + 1))
+            self.write("]")
+        elif isinstance(node, ObjectNode):
+            span.members = []
+            self.write("{")
+            self.properties(node, depth, span)
+            self.write("}")
+        elif isinstance(node, DiscriminatorNode):
+            span.members = []
+            choice = self.rng.choice(list(node.mapping))
+            self.write("{")
+            key_start = self.length
+            self.write(node.property.prefix[1:])
+            choice_span = Span(start=self.length)
+            self.write(json.dumps(choice), mistake='"not-in-enum"')
+            choice_span.end = self.length
+            span.members.append((node.property.key, key_start, choice_span))
+            selected = node.mapping[choice]
+            while isinstance(selected, RefNode):
+                selected = selected.target
+            self.properties(selected, depth, span, skip=node.property.key, first=False)
+            self.write("}")
+        span.end = self.length
+        return span
+
+    def sample(self, plan: SchemaPlan) -> Tuple[str, List[Mistake], Span]:
+        root = self.value(plan.root)
+        return "".join(self.parts), self.mistakes, root
+
+
+def add_whitespace(text: str) -> str:
+    """Pretty-prints compact JSON text the way Claude tends to, one space at a time."""
+    out = []
+    in_string = False
+    escaped = False
+    for char in text:
+        out.append(char)
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in ":,":
+            out.append(" ")
+    return "".join(out)
+
+
+def scalar_end(text: str, start: int) -> int | None:
+    """Where the complete scalar starting at `start` ends, if it does."""
+    if text.startswith('"', start):
+        pos = start + 1
+        while (quote := text.find('"', pos)) != -1:
+            backslashes = quote - len(text[pos:quote].rstrip("\\")) - pos
+            if not backslashes % 2:
+                return quote + 1
+            pos = quote + 1
+        return None
+    for pos in range(start, len(text)):
+        if text[pos] in ",}]":
+            return pos if pos > start else None
+    return None
+
+
+class MockAnthropicClient:
+    """
+    Offline stand-in for `anthropic.Client` that streams completions locally.
+
+    Completions come from a `script` (a list replayed one per request, or a
+    callable receiving the prompt) or, with `from_schema`, from a sampled document
+    that is continued from whatever progress the prompt ends with. Chunk size,
+    latencies and the rate of injected mistakes are configurable, and the client
+    counts requests and bytes so generation cost can be measured without a live
+    account.
+    """
+
+    def __init__(
+        self,
+        script: Union[Sequence[str], Callable[[str], str], None] = None,
+        chunk_size: int = 8,
+        first_chunk_latency: float = 0.0,
+        chunk_latency: float = 0.0,
+        mistake_rate: float = 0.0,
+        whitespace: bool = False,
+        suffix: str = "",
+        seed: int | None = 0,
+    ):
+        self.script = script
+        self.chunk_size = chunk_size
+        self.first_chunk_latency = first_chunk_latency
+        self.chunk_latency = chunk_latency
+        self.mistake_rate = mistake_rate
+        self.whitespace = whitespace
+        self.suffix = suffix
+        self.rng = random.Random(seed)
+        self.document: str | None = None
+        self.mistakes: List[Mistake] = []
+        self.root: Span | None = None
+
+        self.request_count = 0
+        self.mistakes_injected = 0
+        self.prompt_bytes = 0
+        self.streamed_bytes = 0
+        # CPU spent producing chunks, so benchmarks can subtract it
+        self.cpu_time = 0.0
+
+    @classmethod
+    def from_schema(
+        cls,
+        json_schema: Union[Dict[str, Any], SchemaPlan],
+        array_length: int = 3,
+        string_words: int = 3,
+        max_depth: int = 4,
+        omit_rate: float = 0.3,
+        seed: int | None = 0,
+        **kwargs,
+    ) -> "MockAnthropicClient":
+        plan = json_schema if isinstance(json_schema, SchemaPlan) else compile_schema(json_schema)
+        client = cls(seed=seed, **kwargs)
+        sampler = DocumentSampler(
+            client.rng,
+            array_length=array_length,
+            string_words=string_words,
+            max_depth=max_depth,
+            omit_rate=omit_rate,
+        )
+        client.document, client.mistakes, client.root = sampler.sample(plan)
+        return client
+
+    @property
+    def value(self) -> Any:
+        """The document a schema-derived client steers every generation towards."""
+        return json.loads(self.document)
+
+    def locate(self, progress: str, prompt: str = "") -> int:
+        """
+        Returns the position in the document that `progress` leads up to.
+
+        Progress from a forked completion leaves out the sibling members
+        generated elsewhere, and starts arrays at the item its prompt asks for
+        or after the items a windowed prompt left out.
+        """
+        skips = {pointer: int(item) - 1 for item, pointer in ITEM_NOTE.findall(prompt)}
+        skips.update((pointer, int(count)) for count, pointer in WINDOW_NOTE.findall(prompt))
+        if not skips and self.document.startswith(progress):
+            return len(progress)
+        p, position = self.align(self.root, progress, 0, [], skips)
+        if position is None:
+            raise ValueError("Progress diverged from the sampled document")
+        return position
+
+    def align(
+        self, span: Span, progress: str, p: int, path: list, skips: Dict[str, int]
+    ) -> Tuple[int, int | None]:
+        """
+        Matches the value at `span` against `progress` from `p`. Returns where
+        the value ends in `progress`, or the document position at which
+        `progress` runs out inside it.
+        """
+        document = self.document
+        if p == len(progress):
+            return p, span.start
+
+        def expect(text: str):
+            if not progress.startswith(text, p):
+                raise ValueError("Progress diverged from the sampled document")
+
+        if span.members is not None or span.items is not None:
+            expect("{" if span.members is not None else "[")
+            p += 1
+            if span.members is not None:
+                children = [(key, key_start, value) for key, key_start, value in span.members]
+                index = 0
+            else:
+                index = skips.get(json_pointer(path), 0)
+                children = [(index, item.start, item) for index, item in enumerate(span.items)]
+            position = children[index][1] if index < len(children) else span.end - 1
+            first = True
+            while True:
+                if p == len(progress):
+                    return p, position
+                if progress[p] in "}]":
+                    return p + 1, None
+                if not first:
+                    expect(",")
+                    p += 1
+                    position += 1
+                    if p == len(progress):
+                        return p, position
+
+                if span.members is not None:
+                    for index in range(index, len(children)):
+                        key, key_start, value = children[index]
+                        prefix = json.dumps(key) + ":"
+                        rest = progress[p : p + len(prefix)]
+                        if prefix.startswith(rest):
+                            break
+                    else:
+                        raise ValueError("Progress diverged from the sampled document")
+                    if len(rest) < len(prefix):
+                        return len(progress), key_start + len(rest)
+                    p += len(prefix)
+                elif index >= len(children):
+                    raise ValueError("Progress diverged from the sampled document")
+                key, key_start, value = children[index]
+
+                path.append(key)
+                p, inside = self.align(value, progress, p, path, skips)
+                path.pop()
+                if inside is not None:
+                    return p, inside
+                position = value.end
+                index += 1
+                first = False
+
+        text = document[span.start : span.end]
+        rest = progress[p : p + len(text)]
+        if text.startswith(rest):
+            if p + len(rest) == len(progress) and len(rest) < len(text):
+                return len(progress), span.start + len(rest)
+            if rest == text:
+                return p + len(text), None
+
+        # A value other than the sampled one, e.g. a caller default or a null
+        # the engine gave up with; carry on after it like Claude would
+        end = scalar_end(progress, p)
+        if end is None:
+            raise ValueError("Progress diverged from the sampled document")
+        return end, None
+
+    def continue_document(self, progress: str, prompt: str = "") -> str:
+        start = self.locate(progress, prompt)
+        completion = self.document[start:]
+
+        if self.mistake_rate and self.rng.random() < self.mistake_rate:
+            sites = [m for m in self.mistakes if m.start >= start]
+            if sites:
+                mistake = self.rng.choice(sites)
+                self.mistakes_injected += 1
+                completion = (
+                    self.document[start : mistake.start]
+                    + mistake.replacement
+                    + self.document[mistake.end :]
+                )
+        return completion
+
+    def get_completion(self, prompt: str) -> str:
+        if callable(self.script):
+            return self.script(prompt)
+        if self.script is not None:
+            return self.script[min(self.request_count - 1, len(self.script) - 1)]
+
+        progress = prompt[prompt.rfind(anthropic.AI_PROMPT) + len(anthropic.AI_PROMPT) :]
+        return self.continue_document(progress, prompt)
+
+    async def acompletion_stream(self, prompt: str, **kwargs) -> AsyncIterator[dict]:
+        self.request_count += 1
+        self.prompt_bytes += len(prompt)
+
+        start = time.process_time()
+        completion = self.get_completion(prompt)
+        if self.whitespace:
+            completion = add_whitespace(completion)
+        completion += self.suffix
+        self.cpu_time += time.process_time() - start
+
+        return self._stream(completion)
+
+    async def _stream(self, completion: str) -> AsyncIterator[dict]:
+        if self.first_chunk_latency:
+            await asyncio.sleep(self.first_chunk_latency)
+        for end in range(self.chunk_size, len(completion) + self.chunk_size, self.chunk_size):
+            if self.chunk_latency:
+                await asyncio.sleep(self.chunk_latency)
+            else:
+                await asyncio.sleep(0)
+            start = time.process_time()
+            chunk = {"completion": completion[:end], "stop_reason": None}
+            self.streamed_bytes += min(end, len(completion)) - max(end - self.chunk_size, 0)
+            self.cpu_time += time.process_time() - start
+            yield chunk
@@ -0,0 +1,120 @@
+import bisect
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+
+@dataclass
+class ArraySpan:
+    """Where an array written to the progress opens and where each item starts."""
+
+    pointer: str
+    start: int
+    items: List[int] = field(default_factory=list)
+    # Just after the closing "]", once it is written
+    end: int | None = None
+
+
+class ProgressBuffer:
+    """
+    Append-only JSON prefix of the value being generated.
+
+    Keys, separators and accepted scalars are appended as they are committed, so
+    the current length is always known and the text is only joined when a prompt
+    actually needs it.
+    """
+
+    def __init__(self, text: str = ""):
+        self._parts: List[str] = []
+        self._offsets: List[int] = []
+        self._length = 0
+        self._text = ""
+        self._joined_parts = 0
+        self.arrays: List[ArraySpan] = []
+        self.append(text)
+
+    def append(self, text: str):
+        if not text:
+            return
+        self._parts.append(text)
+        self._offsets.append(self._length)
+        self._length += len(text)
+
+    def open_array(self, pointer: str) -> ArraySpan:
+        """Appends "[" and starts tracking the array's items for `windowed`."""
+        span = ArraySpan(pointer, self._length)
+        self.arrays.append(span)
+        self.append("[")
+        return span
+
+    def close_array(self, span: ArraySpan):
+        self.append("]")
+        span.end = self._length
+
+    def adopt_arrays(self, other: "ProgressBuffer", start: int):
+        """
+        Tracks the arrays `other` opened from `start` on, for text of `other`
+        from `start` that is about to be appended here.
+        """
+        shift = self._length - start
+        for span in other.arrays:
+            if span.start >= start:
+                self.arrays.append(
+                    ArraySpan(
+                        span.pointer,
+                        span.start + shift,
+                        [item + shift for item in span.items],
+                        None if span.end is None else span.end + shift,
+                    )
+                )
+
+    def windowed(self, window: int) -> Tuple[str, List[Tuple[str, int]]]:
+        """
+        The text with all but the last `window` finished items of each array
+        left out, and the pointer and number of items left out of each array.
+        """
+        text = self.getvalue()
+        parts = []
+        omitted = []
+        position = 0
+        for span in sorted(self.arrays, key=lambda span: span.start):
+            # The item still being written is always kept
+            count = len(span.items) - window - (1 if span.end is None else 0)
+            if count <= 0 or span.start < position:
+                # Nothing to leave out, or inside items already left out
+                continue
+            parts.append(text[position : span.items[0]])
+            position = span.items[count] if count < len(span.items) else span.end - 1
+            omitted.append((span.pointer, count))
+        parts.append(text[position:])
+        return "".join(parts), omitted
+
+    def getvalue(self) -> str:
+        if self._joined_parts != len(self._parts):
+            self._text += "".join(self._parts[self._joined_parts :])
+            self._joined_parts = len(self._parts)
+        return self._text
+
+    def matches(self, response, start: int = 0) -> bool:
+        """
+        Checks that `response` agrees with this buffer from `start` onward.
+
+        Only the parts appended after `start` are compared, so callers that
+        remember how far a response has been verified pay for the new text only.
+        """
+        if len(response) < self._length or start > self._length:
+            return False
+
+        index = max(bisect.bisect_right(self._offsets, start) - 1, 0)
+        for part, offset in zip(self._parts[index:], self._offsets[index:]):
+            if offset < start:
+                part = part[start - offset :]
+                offset = start
+            if not response.startswith(part, offset):
+                return False
+        return True
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return self.getvalue()
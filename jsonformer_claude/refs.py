@@ -0,0 +1,57 @@
+from typing import Any, Dict
+from urllib.parse import unquote
+
+DEFINITION_SECTIONS = ("definitions", "$defs")
+
+
+def escape(token: str) -> str:
+    return token.replace("~", "~0").replace("/", "~1")
+
+
+def unescape(token: str) -> str:
+    # In this order, so "~01" becomes "~1" rather than "/"
+    return token.replace("~1", "/").replace("~0", "~")
+
+
+class RefIndex:
+    """
+    Resolves local `$ref`s ("#/definitions/name", "#/$defs/name" or any other
+    JSON Pointer into the schema).
+
+    Definitions are indexed by pointer once, when the index is built, so
+    resolving one of them is a dictionary lookup; any other pointer is walked
+    the first time it is asked for and remembered.
+    """
+
+    def __init__(self, schema: Dict[str, Any]):
+        self.schema = schema
+        self.pointers: Dict[str, Any] = {"#": schema}
+        for section in DEFINITION_SECTIONS:
+            definitions = schema.get(section)
+            if isinstance(definitions, dict):
+                for name, definition in definitions.items():
+                    self.pointers[f"#/{section}/{escape(name)}"] = definition
+
+    def resolve(self, ref: str) -> Any:
+        target = self.pointers.get(ref)
+        if target is None:
+            target = self.walk(ref)
+            self.pointers[ref] = target
+        return target
+
+    def walk(self, ref: str) -> Any:
+        if ref != "#" and not ref.startswith("#/"):
+            raise ValueError("Ref must start with #/")
+
+        target = self.schema
+        for token in unquote(ref).split("/")[1:]:
+            token = unescape(token)
+            if isinstance(target, list) and token.isdigit() and int(token) < len(target):
+                target = target[int(token)]
+            elif isinstance(target, dict) and token in target:
+                target = target[token]
+            else:
+                raise ValueError(f"Improper reference {ref}")
+        if not isinstance(target, dict):
+            raise ValueError(f"Reference {ref} is not a schema")
+        return target
@@ -0,0 +1,198 @@
+import json
+import re
+from typing import Any, Dict, Mapping
+
+from jsonformer_claude.refs import DEFINITION_SECTIONS, RefIndex, unescape
+
+JSON = "json"
+MINIFIED = "minified"
+STRIPPED = "stripped"
+TYPESCRIPT = "typescript"
+SCHEMA_FORMATS = (JSON, MINIFIED, STRIPPED, TYPESCRIPT)
+
+# How the prompt introduces the schema in each format
+SCHEMA_HEADERS = {
+    JSON: "Output result in the following JSON schema format:",
+    MINIFIED: "Output result in the following JSON schema format:",
+    STRIPPED: "Output result in the following JSON schema format:",
+    TYPESCRIPT: "Output result as JSON matching the `Output` TypeScript type below:",
+}
+
+# Annotations that don't change what a valid value is
+IGNORED_KEYS = frozenset(
+    {
+        "$schema",
+        "$id",
+        "$anchor",
+        "$comment",
+        "title",
+        "examples",
+        "additionalProperties",
+        "readOnly",
+        "writeOnly",
+        "deprecated",
+    }
+)
+# Keys the TypeScript skeleton expresses in its types rather than in comments
+TYPED_KEYS = frozenset(
+    {
+        "type",
+        "properties",
+        "required",
+        "items",
+        "enum",
+        "const",
+        "$ref",
+        "discriminator",
+        "nullable",
+        "anyOf",
+        "oneOf",
+    }
+    | set(DEFINITION_SECTIONS)
+)
+
+
+def render_schema(plan, schema_format: str = JSON) -> str:
+    """
+    The text of `plan`'s schema as it goes into prompts, rendered once per plan
+    and format:
+
+    - json: the schema as given, `json.dumps` with its default spacing
+    - minified: the same without spaces
+    - stripped: minified, without annotations and unused definitions
+    - typescript: a TypeScript-like skeleton of the value, with the remaining
+      constraints and descriptions as comments
+    """
+    text = plan.renderings.get(schema_format)
+    if text is not None:
+        return text
+    if schema_format == JSON:
+        text = plan.schema_text
+    elif schema_format == MINIFIED:
+        text = json.dumps(plan.schema, separators=(",", ":"))
+    elif schema_format == STRIPPED:
+        text = json.dumps(strip_schema(plan.schema, plan.definitions), separators=(",", ":"))
+    elif schema_format == TYPESCRIPT:
+        text = TypeScriptRenderer(plan.schema, plan.definitions).render()
+    else:
+        raise ValueError(
+            f"Unknown schema format {schema_format!r}, expected one of {SCHEMA_FORMATS}"
+        )
+    plan.renderings[schema_format] = text
+    return text
+
+
+def strip_schema(schema: Any, used_refs: Mapping[str, Any], root: bool = True) -> Any:
+    if not isinstance(schema, dict):
+        return schema
+    stripped = {}
+    for key, value in schema.items():
+        if key in IGNORED_KEYS:
+            continue
+        if key == "properties" and isinstance(value, dict):
+            value = {
+                name: strip_schema(prop, used_refs, False) for name, prop in value.items()
+            }
+        elif key in DEFINITION_SECTIONS and root and isinstance(value, dict):
+            value = {
+                name: strip_schema(definition, used_refs, False)
+                for name, definition in value.items()
+                if any(ref_names(ref, key, name) for ref in used_refs)
+            }
+            if not value:
+                continue
+        elif key == "items":
+            value = strip_schema(value, used_refs, False)
+        elif key in ("anyOf", "oneOf") and isinstance(value, list):
+            value = [strip_schema(variant, used_refs, False) for variant in value]
+        stripped[key] = value
+    return stripped
+
+
+def ref_names(ref: str, section: str, name: str) -> bool:
+    """Whether `ref` points at or into the definition `name` of `section`."""
+    tokens = ref.split("/")
+    return len(tokens) > 2 and tokens[1] == section and unescape(tokens[2]) == name
+
+
+def property_name(name: str) -> str:
+    return name if name.isidentifier() else json.dumps(name)
+
+
+class TypeScriptRenderer:
+    def __init__(self, schema: Dict[str, Any], used_refs: Mapping[str, Any]):
+        self.schema = schema
+        self.refs = RefIndex(schema)
+        # ref -> type name, in the order the declarations are written
+        self.names: Dict[str, str] = {}
+        for ref in used_refs:
+            self.names[ref] = self.type_name(ref)
+
+    def type_name(self, ref: str) -> str:
+        base = re.sub(r"\W", "_", unescape(ref.rsplit("/", 1)[-1])) or "Definition"
+        base = base[0].upper() + base[1:]
+        name = base
+        number = 2
+        while name in self.names.values() or name == "Output":
+            name = f"{base}{number}"
+            number += 1
+        return name
+
+    def render(self) -> str:
+        declarations = [
+            f"type {name}={self.type(self.refs.resolve(ref))};"
+            for ref, name in self.names.items()
+        ]
+        declarations.append(f"type Output={self.type(self.schema)};")
+        return "\n".join(declarations)
+
+    def type(self, schema: Dict[str, Any]) -> str:
+        if "$ref" in schema:
+            text = self.names.get(schema["$ref"]) or self.type(self.refs.resolve(schema["$ref"]))
+        elif "const" in schema:
+            text = json.dumps(schema["const"])
+        elif "enum" in schema:
+            text = "|".join(json.dumps(value) for value in schema["enum"])
+        elif "discriminator" in schema:
+            discriminator = schema["discriminator"]
+            key = property_name(discriminator["propertyName"])
+            text = "|".join(
+                f"{{{key}:{json.dumps(value)}}}&{self.names.get(ref) or self.type(self.refs.resolve(ref))}"
+                for value, ref in discriminator["mapping"].items()
+            )
+        elif "anyOf" in schema or "oneOf" in schema:
+            text = "|".join(self.type(variant) for variant in schema.get("anyOf") or schema["oneOf"])
+        elif isinstance(schema.get("type"), list):
+            # Constraints go in the comment after the union, not in each branch
+            typed = {key: value for key, value in schema.items() if key in TYPED_KEYS}
+            text = "|".join(self.type({**typed, "type": t}) for t in schema["type"])
+        elif schema.get("type") == "array":
+            items = self.type(schema.get("items", {}))
+            if "|" in items or "/*" in items:
+                items = f"({items})"
+            text = items + "[]"
+        elif schema.get("type") == "object" or "properties" in schema:
+            required = schema.get("required")
+            text = "{" + ";".join(
+                f"{property_name(name)}{'' if required is None or name in required else '?'}:"
+                f"{self.type(prop)}"
+                for name, prop in schema.get("properties", {}).items()
+            ) + "}"
+        else:
+            text = {
+                "number": "number",
+                "boolean": "boolean",
+                "string": "string",
+                "null": "null",
+            }.get(schema.get("type"), "unknown")
+        if schema.get("nullable") is True:
+            text += "|null"
+
+        notes = [
+            f"{key}: {value}" if key == "description" else f"{key}: {json.dumps(value)}"
+            for key, value in schema.items()
+            if key not in TYPED_KEYS and key not in IGNORED_KEYS
+        ]
+        if notes:
+            text += " /* " + ", ".join(notes).replace("*/", "* /") + " */"
+        return text
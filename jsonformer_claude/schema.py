@@ -0,0 +1,289 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Sequence, Set, Tuple, Union
+
+from jsonformer_claude.fields.base import BaseField
+from jsonformer_claude.fields.bool import BoolField
+from jsonformer_claude.fields.integer import IntField
+from jsonformer_claude.fields.string import StrField
+from jsonformer_claude.refs import RefIndex
+
+FIELDS = {
+    "number": IntField,
+    "boolean": BoolField,
+    "string": StrField
+}
+
+# Reads the object keys Claude writes, to tell which optional property is next
+KEY_FIELD = FIELDS["string"](schema={"type": "string"})
+
+PLAN_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class ScalarNode:
+    schema: Mapping[str, Any]
+    field: BaseField
+    # JSON text of the only value the schema allows (const or a one-value enum)
+    fixed: str | None = None
+
+
+@dataclass(frozen=True)
+class ArrayNode:
+    schema: Mapping[str, Any]
+    items: "Node"
+
+
+@dataclass(frozen=True)
+class Property:
+    key: str
+    # '"key":', ready to be appended to the progress
+    prefix: str
+    node: "Node"
+    # False when the object lists `required` without this key
+    required: bool = True
+
+
+@dataclass(frozen=True)
+class ObjectNode:
+    schema: Mapping[str, Any]
+    properties: Tuple[Property, ...]
+
+
+@dataclass(frozen=True)
+class DiscriminatorNode:
+    schema: Mapping[str, Any]
+    property: Property
+    # discriminator value -> node of the object it selects
+    mapping: Mapping[str, "Node"]
+
+
+@dataclass(frozen=True)
+class RefNode:
+    ref: str
+    definitions: Mapping[str, "Node"]
+
+    @property
+    def target(self) -> "Node":
+        return self.definitions[self.ref]
+
+
+@dataclass(frozen=True)
+class NullableNode:
+    """An object, array or ref that may be null; scalars read a null themselves."""
+
+    schema: Mapping[str, Any]
+    node: "Node"
+
+
+Node = Union[ScalarNode, ArrayNode, ObjectNode, DiscriminatorNode, RefNode, NullableNode]
+
+
+@dataclass(frozen=True)
+class SchemaPlan:
+    """
+    A JSON schema compiled for generation.
+
+    Refs are resolved once, discriminators carry their dispatch tables and every
+    property knows the text that introduces it, so generating from a plan never
+    walks the raw schema again.
+    """
+
+    key: str
+    schema: Mapping[str, Any]
+    schema_text: str
+    root: ObjectNode
+    definitions: Mapping[str, Node]
+    # Schema format -> text for prompts, filled in by render_schema
+    renderings: Dict[str, str] = field(default_factory=dict, compare=False, repr=False)
+
+
+def is_container(node: Node) -> bool:
+    while isinstance(node, RefNode):
+        node = node.target
+    return not isinstance(node, ScalarNode)
+
+
+def property_groups(properties: Sequence[Property]) -> List[List[Property]]:
+    """
+    Splits properties into groups that can be generated independently: each
+    object, array or discriminator on its own, with the scalars before it.
+    """
+    groups: List[List[Property]] = []
+    for prop in properties:
+        if not groups or is_container(groups[-1][-1].node):
+            groups.append([prop])
+        else:
+            groups[-1].append(prop)
+    return groups
+
+
+def non_null_schema(schema: Mapping[str, Any]) -> Dict[str, Any] | None:
+    """
+    The schema of the non-null values of a schema that also allows null, via
+    `nullable: true`, a type list with "null" or an anyOf / oneOf with a
+    {"type": "null"} branch. None if `schema` doesn't allow null.
+    """
+    if schema.get("nullable") is True:
+        return {key: value for key, value in schema.items() if key != "nullable"}
+    schema_type = schema.get("type")
+    if isinstance(schema_type, list) and "null" in schema_type:
+        types = [t for t in schema_type if t != "null"]
+        if len(types) == 1:
+            return {**schema, "type": types[0]}
+    for keyword in ("anyOf", "oneOf"):
+        variants = schema.get(keyword)
+        if isinstance(variants, list) and {"type": "null"} in variants:
+            others = [variant for variant in variants if variant != {"type": "null"}]
+            if len(others) == 1:
+                rest = {key: value for key, value in schema.items() if key != keyword}
+                return {**rest, **others[0]}
+    return None
+
+
+def fixed_text(schema: Mapping[str, Any]) -> str | None:
+    if "const" in schema:
+        return json.dumps(schema["const"])
+    if len(schema.get("enum", ())) == 1:
+        return json.dumps(schema["enum"][0])
+    return None
+
+
+class SchemaCompiler:
+    def __init__(self, json_schema: Dict[str, Any]):
+        self.json_schema = json_schema
+        self.refs = RefIndex(json_schema)
+        self.definitions: Dict[str, Node] = {}
+        # Refs whose definition is still being compiled
+        self.compiling: Set[str] = set()
+
+    def get_definition_by_ref(self, ref) -> dict:
+        return self.refs.resolve(ref)
+
+    def compile_ref(self, ref: str) -> RefNode:
+        node = RefNode(ref=ref, definitions=self.definitions)
+        if ref not in self.definitions:
+            # Placeholder so recursive references terminate
+            self.definitions[ref] = node
+            self.compiling.add(ref)
+            self.definitions[ref] = self.compile(self.get_definition_by_ref(ref))
+            self.compiling.discard(ref)
+
+            # A ref that only leads to other refs and back can never be generated
+            seen = {ref}
+            target = self.definitions[ref]
+            while isinstance(target, RefNode) and target.ref not in self.compiling:
+                if target.ref in seen:
+                    raise ValueError(f"Circular reference {ref}")
+                seen.add(target.ref)
+                target = self.definitions[target.ref]
+        return node
+
+    def compile_object(self, schema: Dict[str, Any]) -> ObjectNode:
+        # Without `required` every property is, as before it was supported
+        required = schema.get("required")
+        return ObjectNode(
+            schema=schema,
+            properties=tuple(
+                Property(
+                    key=key,
+                    prefix=json.dumps(key) + ":",
+                    node=self.compile(value),
+                    required=required is None or key in required,
+                )
+                for key, value in schema["properties"].items()
+            ),
+        )
+
+    def compile_scalar(self, schema: Dict[str, Any]) -> ScalarNode:
+        return ScalarNode(
+            schema=schema,
+            field=FIELDS[schema["type"]](schema=schema),
+            fixed=None if schema.get("nullable") is True else fixed_text(schema),
+        )
+
+    def compile(self, schema: Dict[str, Any]) -> Node:
+        if (non_null := non_null_schema(schema)) is not None:
+            node = self.compile(non_null)
+            if isinstance(node, ScalarNode):
+                return self.compile_scalar({**non_null, "nullable": True})
+            return NullableNode(schema=schema, node=node)
+
+        schema_type = schema.get("type")
+
+        if schema_type in FIELDS:
+            return self.compile_scalar(schema)
+
+        elif schema_type == "array":
+            return ArrayNode(schema=schema, items=self.compile(schema["items"]))
+
+        elif schema_type == "object":
+            return self.compile_object(schema)
+
+        elif discriminator := schema.get("discriminator"):
+            property_name = discriminator["propertyName"]
+            mapping = discriminator["mapping"]
+
+            property_name_schema = {
+                "type": "string",
+                "enum": [m for m in mapping]
+            }
+
+            return DiscriminatorNode(
+                schema=schema,
+                property=Property(
+                    key=property_name,
+                    prefix="{" + json.dumps(property_name) + ":",
+                    node=self.compile(property_name_schema),
+                ),
+                mapping=MappingProxyType(
+                    {value: self.compile_ref(ref) for value, ref in mapping.items()}
+                ),
+            )
+
+        elif ref := schema.get("$ref"):
+            return self.compile_ref(ref)
+
+        else:
+            raise ValueError(f"Unsupported schema type: {schema_type}")
+
+
+_plan_cache: "OrderedDict[str, SchemaPlan]" = OrderedDict()
+_plan_cache_lock = threading.Lock()
+
+
+def compile_schema(json_schema: Dict[str, Any]) -> SchemaPlan:
+    """
+    Compiles `json_schema`, reusing the plan of any identical schema compiled
+    before in this process.
+    """
+    schema_text = json.dumps(json_schema)
+    key = hashlib.sha256(schema_text.encode()).hexdigest()
+
+    with _plan_cache_lock:
+        plan = _plan_cache.get(key)
+        if plan is not None:
+            _plan_cache.move_to_end(key)
+            return plan
+
+    # Compile a private copy so later edits to the caller's dict can't leak in
+    json_schema = json.loads(schema_text)
+    compiler = SchemaCompiler(json_schema)
+    plan = SchemaPlan(
+        key=key,
+        schema=json_schema,
+        schema_text=schema_text,
+        root=compiler.compile_object(json_schema),
+        definitions=MappingProxyType(compiler.definitions),
+    )
+
+    with _plan_cache_lock:
+        _plan_cache[key] = plan
+        if len(_plan_cache) > PLAN_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+    return plan
+
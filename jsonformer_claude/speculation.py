@@ -0,0 +1,202 @@
+import json
+from typing import Any, Awaitable, Callable, Dict, List, Sequence, Union
+
+from jsonformer_claude.events import json_pointer
+from jsonformer_claude.fields.base import BaseField
+from jsonformer_claude.metrics import schema_pointer
+from jsonformer_claude.schema import (
+    KEY_FIELD,
+    ArrayNode,
+    DiscriminatorNode,
+    Node,
+    NullableNode,
+    ObjectNode,
+    Property,
+    RefNode,
+    ScalarNode,
+)
+from jsonformer_claude.stream import StreamBuffer
+
+
+class Diverged(Exception):
+    """The streamed document has something the generation wouldn't accept."""
+
+
+class DocumentReader:
+    """
+    Checks a streamed document against a plan as its chunks arrive, building
+    the value in the order Claude writes it.
+
+    Scalars go through the same resumable tokenizers as the field-by-field
+    generation, so reading costs O(delta) per chunk, and Diverged is raised at
+    the first token that generation would have rejected rather than once
+    Claude has closed the document.
+    """
+
+    def __init__(
+        self,
+        prefix: str,
+        response: StreamBuffer,
+        read_chunk: Callable[[], Awaitable[Any]],
+        defaults: Dict[str, Any] | None = None,
+        max_ref_depth: int | None = None,
+    ):
+        # The document text before the response starts, i.e. the progress it
+        # was requested from
+        self.prefix = prefix
+        self.response = response
+        self.read_chunk = read_chunk
+        # As JsonformerClaude.defaults: Claude must have written these values
+        self.defaults = defaults or {}
+        # As JsonformerClaude.max_ref_depth: a ref nested deeper must have been
+        # cut short the way the generation cuts it
+        self.max_ref_depth = max_ref_depth
+        self.ref_depth: Dict[str, int] = {}
+        self.position = 0
+        self.path: List[Union[str, int]] = []
+
+    async def available(self) -> str:
+        """The text from `position` that has streamed so far, never empty."""
+        if self.position < len(self.prefix):
+            return self.prefix[self.position :]
+        while len(self.response) <= self.position:
+            try:
+                await self.read_chunk()
+            except StopAsyncIteration:
+                raise Diverged(f"the stream ended at {json_pointer(self.path)}")
+        return self.response.slice(self.position)
+
+    async def peek(self) -> str:
+        return (await self.available())[0]
+
+    async def expect(self, text: str):
+        while text:
+            available = (await self.available())[: len(text)]
+            if not text.startswith(available):
+                raise Diverged(f"expected {text!r} at {json_pointer(self.path)}")
+            self.position += len(available)
+            text = text[len(available) :]
+
+    async def read_scalar(self, field: BaseField) -> Any:
+        start = self.position
+        parser = field.parser()
+        while True:
+            text = await self.available()
+            result = parser.feed(text)
+            if result.value_found:
+                if not result.value_valid:
+                    raise Diverged(f"invalid value {result.text!r} at {json_pointer(self.path)}")
+                self.position = start + len(result.text)
+                return result.value
+            self.position += len(text)
+
+    async def read_value(self, node: Node) -> Any:
+        if self.defaults and (pointer := self.default_pointer()) is not None:
+            await self.expect(json.dumps(self.defaults[pointer]))
+            return self.defaults[pointer]
+
+        if isinstance(node, ScalarNode) and node.fixed is not None:
+            await self.expect(node.fixed)
+            return json.loads(node.fixed)
+
+        elif isinstance(node, ScalarNode):
+            return await self.read_scalar(node.field)
+
+        elif isinstance(node, ArrayNode):
+            if self.ref_exhausted(node.items):
+                await self.expect("[]")
+                return []
+            await self.expect("[")
+            arr = []
+            while await self.peek() != "]":
+                if arr:
+                    await self.expect(",")
+                self.path.append(len(arr))
+                arr.append(await self.read_value(node.items))
+                self.path.pop()
+            self.position += 1
+            return arr
+
+        elif isinstance(node, ObjectNode):
+            await self.expect("{")
+            return await self.read_properties(node.properties, {})
+
+        elif isinstance(node, DiscriminatorNode):
+            key = node.property.key
+            await self.expect(node.property.prefix)
+            discriminator_value = await self.read_member(node.property)
+            selected = node.mapping[discriminator_value]
+            while isinstance(selected, RefNode):
+                selected = selected.target
+            return await self.read_properties(
+                selected.properties, {key: discriminator_value}
+            )
+
+        elif isinstance(node, NullableNode):
+            if await self.peek() == "n":
+                await self.expect("null")
+                return None
+            return await self.read_value(node.node)
+
+        elif isinstance(node, RefNode):
+            if self.ref_exhausted(node):
+                target = node.target
+                while isinstance(target, RefNode):
+                    target = target.target
+                cut = [] if isinstance(target, ArrayNode) else None
+                await self.expect(json.dumps(cut))
+                return cut
+            depth = self.ref_depth.get(node.ref, 0)
+            self.ref_depth[node.ref] = depth + 1
+            try:
+                return await self.read_value(node.target)
+            finally:
+                self.ref_depth[node.ref] = depth
+
+        raise Diverged(f"Unsupported schema node: {node}")
+
+    def ref_exhausted(self, node: Node) -> bool:
+        if self.max_ref_depth is None or not isinstance(node, RefNode):
+            return False
+        # The count includes the outermost occurrence, which isn't nested
+        return self.ref_depth.get(node.ref, 0) > self.max_ref_depth
+
+    def default_pointer(self) -> str | None:
+        for pointer in (json_pointer(self.path), schema_pointer(self.path)):
+            if pointer in self.defaults:
+                return pointer
+        return None
+
+    async def read_properties(
+        self, properties: Sequence[Property], obj: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Reads the members of an object after its "{", up to its "}"."""
+        properties = [prop for prop in properties if prop.key not in obj]
+        if all(prop.required for prop in properties):
+            # In schema order, as generate_properties writes them
+            for prop in properties:
+                if obj:
+                    await self.expect(",")
+                await self.expect(prop.prefix)
+                obj[prop.key] = await self.read_member(prop)
+        else:
+            remaining = {prop.key: prop for prop in properties}
+            while await self.peek() != "}":
+                if obj:
+                    await self.expect(",")
+                key = await self.read_scalar(KEY_FIELD)
+                if key not in remaining:
+                    raise Diverged(f"unexpected key {key!r} at {json_pointer(self.path)}")
+                await self.expect(":")
+                obj[key] = await self.read_member(remaining.pop(key))
+            missing = [prop.key for prop in remaining.values() if prop.required]
+            if missing:
+                raise Diverged(f"missing {missing} at {json_pointer(self.path)}")
+        await self.expect("}")
+        return obj
+
+    async def read_member(self, prop: Property) -> Any:
+        self.path.append(prop.key)
+        value = await self.read_value(prop.node)
+        self.path.pop()
+        return value
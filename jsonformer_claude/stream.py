@@ -0,0 +1,88 @@
+import bisect
+from typing import List
+
+WHITESPACE = str.maketrans("", "", " \t\n")
+
+
+class StreamBuffer:
+    """
+    Whitespace-normalized text of a streamed completion.
+
+    Positions are shared with the progress the completion was requested from: the
+    first character Claude produced sits at `start`, which is the length of the
+    progress at request time. Only new deltas are scanned, and whitespace outside
+    of strings is dropped as they arrive, so feeding a chunk costs O(delta).
+    """
+
+    def __init__(self, start: int = 0):
+        self.start = start
+        self.finished = False
+        self._chunks: List[str] = []
+        self._offsets: List[int] = []
+        self._length = start
+        self._in_string = False
+        self._backslashes = 0
+
+    def feed(self, delta: str) -> str:
+        """Normalizes and appends `delta`, returning the text that was kept."""
+        kept = []
+        pos = 0
+        while pos < len(delta):
+            quote = delta.find('"', pos)
+            end = len(delta) if quote == -1 else quote
+            segment = delta[pos:end]
+            if not self._in_string:
+                segment = segment.translate(WHITESPACE)
+                self._backslashes = 0
+            elif segment:
+                trailing = len(segment) - len(segment.rstrip("\\"))
+                if trailing == len(segment):
+                    self._backslashes += trailing
+                else:
+                    self._backslashes = trailing
+            kept.append(segment)
+
+            if quote == -1:
+                break
+            if not (self._in_string and self._backslashes % 2):
+                self._in_string = not self._in_string
+            self._backslashes = 0
+            kept.append('"')
+            pos = quote + 1
+
+        text = "".join(kept)
+        if text:
+            self._chunks.append(text)
+            self._offsets.append(self._length)
+            self._length += len(text)
+        return text
+
+    def slice(self, start: int, end: int | None = None) -> str:
+        """Returns the text between two positions, joining only the chunks involved."""
+        start = max(start, self.start)
+        end = self._length if end is None else min(end, self._length)
+        if start >= end:
+            return ""
+
+        index = bisect.bisect_right(self._offsets, start) - 1
+        parts = []
+        while index < len(self._chunks) and self._offsets[index] < end:
+            chunk, offset = self._chunks[index], self._offsets[index]
+            parts.append(chunk[max(start - offset, 0) : end - offset])
+            index += 1
+        return "".join(parts)
+
+    def startswith(self, prefix: str, start: int = 0) -> bool:
+        return self.slice(start, start + len(prefix)) == prefix
+
+    def __getitem__(self, index: int) -> str:
+        if not self.start <= index < self._length:
+            raise IndexError("stream index out of range")
+        chunk = bisect.bisect_right(self._offsets, index) - 1
+        return self._chunks[chunk][index - self._offsets[chunk]]
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __str__(self) -> str:
+        return "".join(self._chunks)
@@ -0,0 +1,120 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Dict, Union
+
+import anthropic
+
+from jsonformer_claude.backends import CompletionBackend
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.schema import SchemaPlan, compile_schema
+
+
+class SyncJsonformerClaude:
+    """
+    Blocking entry points for synchronous code. Generations run on one
+    long-lived event loop in a background thread, shared by every caller and
+    every thread, so a job only waits on a future instead of creating and
+    tearing down an event loop per call.
+
+    Keyword arguments are passed on to each JsonformerClaude, and can be
+    overridden per call, e.g. `defaults` or Claude's `temperature`.
+    """
+
+    def __init__(
+        self,
+        anthropic_client: Union[anthropic.Client, CompletionBackend],
+        json_schema: Union[Dict[str, Any], SchemaPlan],
+        **engine_args,
+    ):
+        if isinstance(json_schema, SchemaPlan):
+            self.plan = json_schema
+        else:
+            self.plan = compile_schema(json_schema)
+        self.anthropic_client = anthropic_client
+        self.engine_args = engine_args
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self._run, name="jsonformer-claude", daemon=True
+        )
+        self.thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    async def _generate(
+        self, prompt: str, json_schema: Union[Dict[str, Any], SchemaPlan, None], engine_args
+    ) -> Dict[str, Any]:
+        gen_json = JsonformerClaude(
+            anthropic_client=self.anthropic_client,
+            json_schema=self.plan if json_schema is None else json_schema,
+            prompt=prompt,
+            **{**self.engine_args, **engine_args},
+        )
+        return await gen_json()
+
+    def submit(
+        self,
+        prompt: str,
+        json_schema: Union[Dict[str, Any], SchemaPlan, None] = None,
+        **engine_args,
+    ) -> concurrent.futures.Future:
+        """
+        Starts a generation on the background loop and returns a future for its
+        value. Safe to call from any thread; cancelling the future cancels the
+        generation.
+        """
+        if self.loop.is_closed():
+            raise RuntimeError("SyncJsonformerClaude is closed")
+        return asyncio.run_coroutine_threadsafe(
+            self._generate(prompt, json_schema, engine_args), self.loop
+        )
+
+    def generate(
+        self,
+        prompt: str,
+        json_schema: Union[Dict[str, Any], SchemaPlan, None] = None,
+        timeout: float | None = None,
+        **engine_args,
+    ) -> Dict[str, Any]:
+        """
+        Generates a value and blocks until it is ready. The generation is
+        cancelled if it doesn't finish within `timeout` seconds.
+        """
+        if threading.get_ident() == self.thread.ident:
+            # Blocking here would stop the loop the generation needs
+            raise RuntimeError("generate can't be called from the generation loop")
+        future = self.submit(prompt, json_schema, **engine_args)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    async def _shutdown(self):
+        tasks = [
+            task for task in asyncio.all_tasks() if task is not asyncio.current_task()
+        ]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if isinstance(self.anthropic_client, CompletionBackend):
+            # Its connections belong to this loop
+            await self.anthropic_client.close()
+        await self.loop.shutdown_asyncgens()
+
+    def close(self):
+        """Cancels running generations and stops the background loop."""
+        if self.loop.is_closed():
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def __enter__(self) -> "SyncJsonformerClaude":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
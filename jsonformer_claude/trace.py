@@ -0,0 +1,290 @@
+"""
+Records what a generation did, and replays recorded generations offline.
+
+    python -m jsonformer_claude.trace trace.jsonl
+    python -m jsonformer_claude.trace trace.jsonl --realtime --speculative
+"""
+import argparse
+import asyncio
+import collections
+import itertools
+import json
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Iterable, List, Tuple, Union
+
+import anthropic
+
+from jsonformer_claude.backends import CompletionBackend
+
+GENERATION = "generation"
+REQUEST = "request"
+CHUNK = "chunk"
+CLOSE = "close"
+PREFIX = "prefix"
+ACCEPT = "accept"
+RESULT = "result"
+
+# Engine options a replay reuses unless told otherwise
+REPLAYED_OPTIONS = (
+    "speculative",
+    "parallel",
+    "defaults",
+    "array_window",
+    "max_ref_depth",
+    "schema_format",
+    "deadline",
+    "max_requests",
+)
+
+
+class Trace:
+    """
+    Records generation events: every prompt sent, every chunk received with its
+    time, every prefix check and every accepted value.
+
+    Events are kept as tuples and only turned into JSON when they are written,
+    so recording costs an append. Without a `path` the last `capacity` events
+    are kept in memory; with one, they are written there as JSON lines at the
+    end of each generation. Share one trace between generations to record a
+    batch.
+    """
+
+    def __init__(self, path: str | None = None, capacity: int = 100_000):
+        self.path = path
+        self.events: Deque[Tuple[float, int, str, tuple]] = collections.deque(
+            maxlen=None if path else capacity
+        )
+        self.started = time.perf_counter()
+        self.ids = itertools.count(1)
+
+    def record(self, generation: int, kind: str, *fields):
+        self.events.append((time.perf_counter() - self.started, generation, kind, fields))
+
+    def begin(self, **details) -> int:
+        """Starts recording a generation, returning its id for later events."""
+        generation = next(self.ids)
+        self.record(generation, GENERATION, details)
+        return generation
+
+    def request(self, generation: int, prompt: str, reason: str, pointer: str) -> int:
+        request = next(self.ids)
+        self.record(generation, REQUEST, request, prompt, reason, pointer)
+        return request
+
+    def flush(self):
+        if self.path is None or not self.events:
+            return
+        with open(self.path, "a") as f:
+            f.writelines(json.dumps(event_dict(event)) + "\n" for event in self.events)
+        self.events.clear()
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            f.writelines(json.dumps(event_dict(event)) + "\n" for event in self.events)
+
+    @staticmethod
+    def load(path: str) -> List[Dict[str, Any]]:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+# Field names of each event kind, in recording order
+EVENT_FIELDS = {
+    GENERATION: ("details",),
+    REQUEST: ("request", "prompt", "reason", "pointer"),
+    CHUNK: ("request", "text"),
+    CLOSE: ("request", "finished"),
+    PREFIX: ("position", "matches"),
+    ACCEPT: ("pointer", "text"),
+    RESULT: ("value", "error"),
+}
+
+
+def event_dict(event: Tuple[float, int, str, tuple]) -> Dict[str, Any]:
+    time_offset, generation, kind, fields = event
+    return {
+        "t": round(time_offset, 6),
+        "generation": generation,
+        "kind": kind,
+        **dict(zip(EVENT_FIELDS[kind], fields)),
+    }
+
+
+@dataclass(eq=False)
+class RecordedStream:
+    chunks: List[Tuple[float, str]]
+
+
+def continued_text(prompt: str) -> str:
+    """The assistant turn a prompt ends with, which the completion continues."""
+    return prompt[prompt.rfind(anthropic.AI_PROMPT) + len(anthropic.AI_PROMPT) :]
+
+
+class ReplayBackend(CompletionBackend):
+    """
+    Serves the completions recorded for one generation, matched by prompt in
+    the order they were sent, or failing that by the text the prompt asks to
+    continue, so a replay with e.g. another schema format still finds them.
+    With `realtime`, chunks arrive with their recorded timing; otherwise as
+    fast as the engine reads them. A stream the original generation abandoned
+    ends where it was abandoned.
+    """
+
+    def __init__(self, events: Iterable[Dict[str, Any]], realtime: bool = False):
+        self.realtime = realtime
+        self.streams: Dict[str, Deque[RecordedStream]] = collections.defaultdict(
+            collections.deque
+        )
+        self.continuations: Dict[str, Deque[RecordedStream]] = collections.defaultdict(
+            collections.deque
+        )
+        requests: Dict[int, Tuple[float, RecordedStream]] = {}
+        for event in events:
+            if event["kind"] == REQUEST:
+                stream = RecordedStream(chunks=[])
+                requests[event["request"]] = (event["t"], stream)
+                self.streams[event["prompt"]].append(stream)
+                self.continuations[continued_text(event["prompt"])].append(stream)
+            elif event["kind"] == CHUNK:
+                requested, stream = requests[event["request"]]
+                stream.chunks.append((event["t"] - requested, event["text"]))
+
+    async def start(self, prompt: str, stop_sequences: List[str], **claude_args) -> AsyncIterator[str]:
+        for streams, key in (
+            (self.streams, prompt),
+            (self.continuations, continued_text(prompt)),
+        ):
+            if streams.get(key):
+                stream = streams[key].popleft()
+                break
+        else:
+            raise ValueError("The trace has no recorded completion for this prompt")
+        # Each recording is served once, whichever way it was found
+        for streams, key in (
+            (self.streams, prompt),
+            (self.continuations, continued_text(prompt)),
+        ):
+            if stream in streams.get(key, ()):
+                streams[key].remove(stream)
+        return self._stream(stream)
+
+    async def _stream(self, stream: RecordedStream) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        for offset, text in stream.chunks:
+            if self.realtime:
+                await asyncio.sleep(max(offset - (time.perf_counter() - started), 0))
+            else:
+                await asyncio.sleep(0)
+            yield text
+
+
+@dataclass
+class ReplayResult:
+    generation: int
+    # Whether the replay produced the value the recording did
+    matches: bool
+    requests: int
+    recorded_requests: int
+    elapsed: float
+    recorded_elapsed: float
+    cpu_time: float
+    error: BaseException | None = None
+
+
+async def replay(
+    trace: Union[Trace, str, List[Dict[str, Any]]], realtime: bool = False, **engine_args
+) -> List[ReplayResult]:
+    """
+    Runs every generation recorded in `trace` again, offline, against its
+    recorded completions. `engine_args` override the recorded engine options,
+    e.g. to compare an engine change on real traffic.
+    """
+    from jsonformer_claude.main import JsonformerClaude
+
+    if isinstance(trace, str):
+        events = Trace.load(trace)
+    elif isinstance(trace, Trace):
+        events = [event_dict(event) for event in trace.events]
+    else:
+        events = trace
+
+    generations: Dict[int, List[Dict[str, Any]]] = collections.defaultdict(list)
+    for event in events:
+        generations[event["generation"]].append(event)
+
+    results = []
+    for generation, recorded in generations.items():
+        if recorded[0]["kind"] != GENERATION:
+            # Its start fell out of the ring buffer
+            continue
+        details = recorded[0]["details"]
+        outcome = next((event for event in recorded if event["kind"] == RESULT), None)
+        options = {key: details[key] for key in REPLAYED_OPTIONS if key in details}
+        gen_json = JsonformerClaude(
+            anthropic_client=ReplayBackend(recorded, realtime),
+            json_schema=details["schema"],
+            prompt=details["prompt"],
+            **{**options, **engine_args},
+            **details["claude_args"],
+        )
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        error = None
+        try:
+            value = await gen_json()
+        except Exception as e:
+            value, error = None, e
+        results.append(
+            ReplayResult(
+                generation=generation,
+                matches=outcome is not None and error is None and value == outcome["value"],
+                requests=gen_json.llm_request_count,
+                recorded_requests=sum(event["kind"] == REQUEST for event in recorded),
+                elapsed=time.perf_counter() - started,
+                recorded_elapsed=(outcome or recorded[-1])["t"] - recorded[0]["t"],
+                cpu_time=time.process_time() - cpu_started,
+                error=error,
+            )
+        )
+    return results
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m jsonformer_claude.trace",
+        description="Replays the generations of a trace file offline.",
+    )
+    parser.add_argument("trace", help="JSON lines written by Trace(path=...)")
+    parser.add_argument("--realtime", action="store_true", help="keep the recorded chunk timing")
+    parser.add_argument("--speculative", action="store_true", default=None)
+    parser.add_argument("--parallel", action="store_true", default=None)
+    parser.add_argument("--array-window", type=int)
+    parser.add_argument("--schema-format")
+    args = parser.parse_args(argv)
+
+    overrides = {
+        key: value
+        for key, value in (
+            ("speculative", args.speculative),
+            ("parallel", args.parallel),
+            ("array_window", args.array_window),
+            ("schema_format", args.schema_format),
+        )
+        if value is not None
+    }
+    results = asyncio.run(replay(args.trace, realtime=args.realtime, **overrides))
+
+    print(f"{'generation':>10}{'same':>6}{'requests':>10}{'recorded':>10}{'cpu ms':>10}{'ms':>10}{'recorded ms':>13}")
+    for r in results:
+        print(
+            f"{r.generation:>10}{'yes' if r.matches else 'no':>6}{r.requests:>10}"
+            f"{r.recorded_requests:>10}{r.cpu_time * 1e3:>10.2f}{r.elapsed * 1e3:>10.1f}"
+            f"{r.recorded_elapsed * 1e3:>13.1f}"
+            + (f"  {type(r.error).__name__}: {r.error}" if r.error else "")
+        )
+    return 0 if all(r.matches for r in results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,22 @@
+import asyncio
+
+import pytest
+
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+
+
+@pytest.fixture
+def generate():
+    """
+    Runs one generation of `schema`, by default against a mock of documents
+    of it, and returns the value with the engine that produced it.
+    """
+
+    def generate(schema, mock=None, **engine_args):
+        if mock is None:
+            mock = MockAnthropicClient.from_schema(schema, seed=1)
+        gen_json = JsonformerClaude(mock, schema, "p", **engine_args)
+        return asyncio.run(gen_json()), gen_json
+
+    return generate
@@ -0,0 +1,142 @@
+import asyncio
+import time
+
+import pytest
+
+from jsonformer_claude.backends import (
+    ClientBackend,
+    CompletionBackend,
+    HedgedBackend,
+    LocalBackend,
+)
+from jsonformer_claude.main import JsonformerClaude
+
+
+async def read(stream):
+    return [delta async for delta in stream]
+
+
+def test_client_backend_turns_cumulative_completions_into_deltas():
+    class Client:
+        async def acompletion_stream(self, **kwargs):
+            async def events():
+                for completion in ("a", "ab", "abcd"):
+                    yield {"completion": completion}
+
+            return events()
+
+    async def main():
+        return await read(await ClientBackend(Client()).start("p", []))
+
+    assert asyncio.run(main()) == ["a", "b", "cd"]
+
+
+def test_local_backend_chunks_and_stops():
+    backend = LocalBackend(lambda prompt: "abcdefgSTOPxyz", chunk_size=3)
+
+    async def main():
+        return await read(await backend.start("p", ["STOP"]))
+
+    assert asyncio.run(main()) == ["abc", "def", "g"]
+    assert backend.prompts == ["p"]
+
+
+class Stalling(LocalBackend):
+    """Stalls `stalls` streams for a second before the chunk at `at`."""
+
+    def __init__(self, *args, stalls=1, at=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stalls = stalls
+        self.at = at
+        self.opened = 0
+        self.closed = 0
+
+    async def _stream(self, completion):
+        self.opened += 1
+        stall = self.stalls > 0
+        self.stalls -= 1
+        try:
+            for index in range(0, len(completion), self.chunk_size):
+                if stall and index // self.chunk_size == self.at:
+                    await asyncio.sleep(1)
+                yield completion[index : index + self.chunk_size]
+        finally:
+            self.closed += 1
+
+
+def hedged_read(backend, prompt="p"):
+    hedged = HedgedBackend(backend, deadline=0.05)
+
+    async def main():
+        started = time.perf_counter()
+        text = "".join(await read(await hedged.start(prompt, [])))
+        # Give cancelled losers a moment to close
+        await asyncio.sleep(0.01)
+        return text, time.perf_counter() - started
+
+    text, elapsed = asyncio.run(main())
+    return text, elapsed, hedged
+
+
+def test_slow_first_chunk_is_hedged():
+    backend = Stalling(lambda prompt: "0123456789", chunk_size=2)
+    text, elapsed, hedged = hedged_read(backend)
+    assert text == "0123456789"
+    assert elapsed < 0.5
+    assert (hedged.fired, hedged.won) == (1, 1)
+    assert backend.opened == backend.closed == 2
+
+
+def test_stall_mid_stream_is_hedged_with_the_text_so_far():
+    backend = Stalling(lambda prompt: "0123456789"[len(prompt) - 1 :], chunk_size=2, at=2)
+    text, elapsed, hedged = hedged_read(backend)
+    assert text == "0123456789"
+    assert elapsed < 0.5
+    assert backend.prompts == ["p", "p0123"]
+    assert backend.opened == backend.closed == 2
+
+
+def test_slow_start_is_hedged():
+    calls = []
+
+    async def complete(prompt):
+        calls.append(prompt)
+        if len(calls) == 1:
+            await asyncio.sleep(1)
+        return "done"
+
+    text, elapsed, hedged = hedged_read(LocalBackend(complete))
+    assert text == "done"
+    assert elapsed < 0.5
+    assert (hedged.fired, hedged.won) == (1, 1)
+
+
+def test_hedges_are_counted_per_generation():
+    schema = {"type": "object", "properties": {"a": {"type": "string"}}}
+    hedged = HedgedBackend(Stalling(lambda prompt: '"x"}', chunk_size=2), deadline=0.05)
+    engines = [JsonformerClaude(hedged, schema, "p") for _ in range(6)]
+
+    async def main():
+        return await asyncio.gather(*(engine() for engine in engines))
+
+    assert asyncio.run(main()) == [{"a": "x"}] * 6
+    # Only the one stalled stream was hedged, and it is its generation's
+    assert sorted(engine.hedges_fired for engine in engines) == [0] * 5 + [1]
+    assert sorted(engine.hedges_won for engine in engines) == [0] * 5 + [1]
+    assert (hedged.fired, hedged.won) == (1, 1)
+
+
+def test_fast_streams_are_not_hedged():
+    backend = Stalling(lambda prompt: "0123456789", chunk_size=2, stalls=0)
+    text, _, hedged = hedged_read(backend)
+    assert text == "0123456789"
+    assert hedged.fired == 0
+    assert backend.opened == backend.closed == 1
+
+
+def test_backends_must_implement_start():
+    class Incomplete(CompletionBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
@@ -0,0 +1,92 @@
+import json
+import time
+
+import pytest
+
+from jsonformer_claude.budget import DEADLINE, REQUESTS
+from jsonformer_claude.cache import ResponseCache
+from jsonformer_claude.mock import MockAnthropicClient
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "a": {"type": "number", "default": 7},
+        "b": {"type": "string"},
+        "c": {"type": "array", "items": {"type": "number"}},
+    },
+}
+
+UNION = {
+    "type": "object",
+    "$defs": {
+        "car": {
+            "type": "object",
+            "properties": {"kind": {"type": "string"}, "doors": {"type": "number"}},
+        },
+        "bike": {
+            "type": "object",
+            "properties": {"kind": {"type": "string"}, "gears": {"type": "number"}},
+        },
+    },
+    "properties": {
+        "vehicle": {
+            "discriminator": {
+                "propertyName": "kind",
+                "mapping": {"car": "#/$defs/car", "bike": "#/$defs/bike"},
+            }
+        }
+    },
+}
+
+
+def test_a_stalled_stream_stops_at_the_deadline(generate):
+    mock = MockAnthropicClient.from_schema(SCHEMA, first_chunk_latency=1.0)
+    started = time.perf_counter()
+    value, gen_json = generate(SCHEMA, mock, deadline=0.1)
+    assert time.perf_counter() - started < 0.5
+    assert value == {"a": 7, "b": None, "c": []}
+    assert gen_json.incomplete == ["/a", "/b", "/c"]
+    assert gen_json.budget_exhausted == DEADLINE
+    assert json.loads(gen_json.get_progress()) == value
+
+
+def test_no_requests_fills_in_everything(generate):
+    value, gen_json = generate(SCHEMA, max_requests=0)
+    assert value == {"a": 7, "b": None, "c": []}
+    assert gen_json.anthropic_client.request_count == 0
+    assert gen_json.budget_exhausted == REQUESTS
+
+
+def test_values_streamed_before_the_budget_ran_out_are_kept(generate):
+    # The second completion, for the invalid "b", is over budget
+    mock = MockAnthropicClient(script=['5,"b":9,"c":[1]}'])
+    value, gen_json = generate(SCHEMA, mock, max_requests=1)
+    assert value == {"a": 5, "b": None, "c": []}
+    assert gen_json.incomplete == ["/b", "/c"]
+    assert gen_json.llm_request_count == 1
+    assert json.loads(gen_json.get_progress()) == value
+
+
+@pytest.mark.parametrize("max_requests", [None, 3])
+def test_a_generation_within_budget_is_complete(generate, max_requests):
+    value, gen_json = generate(SCHEMA, max_requests=max_requests)
+    assert value == gen_json.anthropic_client.value
+    assert gen_json.incomplete == []
+    assert gen_json.budget_exhausted is None
+
+
+def test_a_discriminator_tag_out_of_budget_is_filled_in(generate):
+    value, gen_json = generate(UNION, max_requests=0)
+    assert value == {"vehicle": {"kind": None}}
+    assert gen_json.incomplete == ["/vehicle/kind"]
+    assert json.loads(gen_json.get_progress()) == value
+
+
+def test_partial_values_are_evicted_from_the_cache(generate):
+    cache = ResponseCache()
+    _, gen_json = generate(SCHEMA, cache=cache, max_requests=0)
+    assert gen_json.incomplete
+    value, gen_json = generate(SCHEMA, cache=cache)
+    assert value == gen_json.anthropic_client.value
+    assert gen_json.incomplete == []
+    assert gen_json.llm_request_count == 1
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from jsonformer_claude.cache import ResponseCache
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"a": {"type": "number"}, "b": {"type": "string"}},
+}
+
+
+def test_cached_generation_is_reused(generate):
+    cache = ResponseCache()
+    first, _ = generate(SCHEMA, cache=cache)
+    second, gen_json = generate(SCHEMA, cache=cache)
+    assert second == first
+    assert gen_json.anthropic_client.request_count == 0
+
+
+def test_defaults_are_part_of_the_key(generate):
+    cache = ResponseCache()
+    first, _ = generate(SCHEMA, cache=cache)
+    second, gen_json = generate(SCHEMA, cache=cache, defaults={"/a": 99})
+    assert second["a"] == 99
+    assert second["b"] == first["b"]
+    assert gen_json.anthropic_client.request_count == 1
+
+
+def test_max_ref_depth_is_part_of_the_key(generate):
+    cache = ResponseCache()
+    generate(SCHEMA, cache=cache)
+    _, gen_json = generate(SCHEMA, cache=cache, max_ref_depth=2)
+    assert gen_json.anthropic_client.request_count == 1
+
+
+def test_checkpoint_of_other_defaults_is_ignored(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    mock = MockAnthropicClient.from_schema(SCHEMA, seed=1)
+    gen_json = JsonformerClaude(mock, SCHEMA, "p", checkpoint_path=path)
+    gen_json.progress.append('{"a":5')
+    gen_json.checkpoint(force=True)
+
+    assert JsonformerClaude(mock, SCHEMA, "p", checkpoint_path=path).resume()
+    other = JsonformerClaude(mock, SCHEMA, "p", checkpoint_path=path, defaults={"/a": 99})
+    assert not other.resume()
+
+
+LONG = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "lines": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+
+class Dropping(MockAnthropicClient):
+    """Drops the connection of the first stream after `chunks` chunks."""
+
+    chunks = 10
+
+    async def _stream(self, completion):
+        sent = 0
+        async for chunk in super()._stream(completion):
+            if self.request_count == 1 and sent == self.chunks:
+                raise ConnectionError("connection dropped")
+            sent += 1
+            yield chunk
+
+
+def test_a_crashed_generation_resumes_from_its_checkpoint(tmp_path):
+    path = str(tmp_path / "checkpoint.json")
+    mock = Dropping.from_schema(LONG, array_length=10)
+    crashed = JsonformerClaude(mock, LONG, "p", checkpoint_path=path, checkpoint_interval=0)
+    with pytest.raises(ConnectionError):
+        asyncio.run(crashed())
+    with open(path) as f:
+        saved = json.load(f)
+    # Partway through the array, with its first item committed
+    assert mock.document.startswith(saved["progress"])
+    assert saved["progress"].startswith('{"title":"' + mock.value["title"] + '","lines":["')
+
+    # A new process, with a connection that holds
+    mock = MockAnthropicClient.from_schema(LONG, array_length=10)
+    resumed = JsonformerClaude(mock, LONG, "p", checkpoint_path=path)
+    assert asyncio.run(resumed()) == mock.value
+    # One request, continuing from the saved prefix instead of starting over
+    assert mock.request_count == 1
+    assert resumed.last_prompt.endswith(saved["progress"])
+    assert not os.path.exists(path)
@@ -0,0 +1,96 @@
+import io
+import json
+
+import pytest
+
+from jsonformer_claude import cli
+from jsonformer_claude.mock import MockAnthropicClient
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"name": {"type": "string"}, "age": {"type": "number"}},
+}
+
+
+@pytest.fixture
+def files(tmp_path):
+    schema = tmp_path / "schema.json"
+    schema.write_text(json.dumps(SCHEMA))
+    prompts = tmp_path / "prompts.jsonl"
+    prompts.write_text(
+        '{"id": "a", "prompt": "first"}\n'
+        '"second, with its line number as id"\n'
+        "\n"
+        '{"id": 7, "prompt": "third"}\n'
+    )
+    return str(schema), str(prompts), str(tmp_path / "results.jsonl")
+
+
+def results(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def run(files, *flags):
+    schema, prompts, output = files
+    return cli.main([schema, prompts, "-o", output, "--mock", "--progress-interval", "0", *flags])
+
+
+def test_writes_a_result_per_prompt(files):
+    assert run(files) == 0
+    value = MockAnthropicClient.from_schema(SCHEMA).value
+    written = results(files[2])
+    assert sorted(json.dumps(record["id"]) for record in written) == ['"a"', "2", "7"]
+    assert all(record["value"] == value for record in written)
+
+
+def test_reads_prompts_from_stdin(files, monkeypatch):
+    schema, prompts, output = files
+    with open(prompts) as f:
+        monkeypatch.setattr("sys.stdin", io.StringIO(f.read()))
+    assert cli.main([schema, "-", "-o", output, "--mock", "--progress-interval", "0"]) == 0
+    assert len(results(output)) == 3
+
+
+def test_a_rerun_skips_completed_ids(files, capsys):
+    run(files)
+    capsys.readouterr()
+    assert run(files) == 0
+    assert len(results(files[2])) == 3
+    assert "3 skipped" in capsys.readouterr().err
+
+
+def test_a_rerun_retries_failed_and_incomplete_ids(files):
+    incomplete = {"name": None, "age": None}
+    with open(files[2], "w") as f:
+        f.write(json.dumps({"id": "a", "error": "TimeoutError: "}) + "\n")
+        f.write(json.dumps({"id": 2, "value": incomplete, "incomplete": ["/name"]}) + "\n")
+        f.write(json.dumps({"id": 7, "value": {"name": "x", "age": 1}}) + "\n")
+        # Cut short by an interrupted run
+        f.write('{"id": 7, "val')
+    assert run(files) == 0
+    with open(files[2]) as f:
+        retried = [json.loads(line) for line in f.read().splitlines()[4:]]
+    assert sorted(json.dumps(record["id"]) for record in retried) == ['"a"', "2"]
+    assert all("value" in record and "incomplete" not in record for record in retried)
+    assert cli.completed_ids(files[2]) == {'"a"', "2", "7"}
+
+
+def test_values_cut_short_are_marked_incomplete(files):
+    assert run(files, "--max-requests", "0") == 0
+    assert all(record["incomplete"] == ["/name", "/age"] for record in results(files[2]))
+    # So the next run generates them again
+    assert cli.completed_ids(files[2]) == set()
+
+
+def test_the_exit_status_says_whether_a_generation_failed(files, monkeypatch):
+    class Failing(MockAnthropicClient):
+        async def acompletion_stream(self, prompt, **kwargs):
+            if "third" in prompt:
+                raise ConnectionError("refused")
+            return await super().acompletion_stream(prompt, **kwargs)
+
+    monkeypatch.setattr(cli, "make_client", lambda args, schema: Failing.from_schema(schema))
+    assert run(files) == 1
+    errors = [record for record in results(files[2]) if "error" in record]
+    assert errors == [{"id": 7, "error": "ConnectionError: refused"}]
@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+from jsonformer_claude import events
+from jsonformer_claude.cache import ResponseCache
+from jsonformer_claude.events import FieldEvent
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "tags": {"type": "array", "items": {"type": "string"}},
+        "car": {"type": "object", "properties": {"year": {"type": "number"}}},
+        "owners": {
+            "type": "array",
+            "items": {"type": "object", "properties": {"name": {"type": "string"}}},
+        },
+    },
+}
+
+
+def expected_events(value, pointer=""):
+    if isinstance(value, dict):
+        yield FieldEvent(events.START_OBJECT, pointer)
+        for key, item in value.items():
+            yield from expected_events(item, f"{pointer}/{key}")
+        yield FieldEvent(events.END_OBJECT, pointer)
+    elif isinstance(value, list):
+        yield FieldEvent(events.START_ARRAY, pointer)
+        for index, item in enumerate(value):
+            yield from expected_events(item, f"{pointer}/{index}")
+        yield FieldEvent(events.END_ARRAY, pointer)
+    else:
+        yield FieldEvent(events.VALUE, pointer, value)
+
+
+def subtree(received, pointer):
+    return [event for event in received if event.pointer.startswith(pointer + "/")]
+
+
+def collect(gen_json):
+    async def main():
+        return [event async for event in gen_json.stream_events()]
+
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("engine_args", [{}, {"speculative": True}, {"mistake_rate": 0.5}])
+def test_events_follow_the_document(engine_args):
+    mistake_rate = engine_args.pop("mistake_rate", 0.0)
+    mock = MockAnthropicClient.from_schema(SCHEMA, seed=2, mistake_rate=mistake_rate)
+    gen_json = JsonformerClaude(mock, SCHEMA, "p", **engine_args)
+    assert collect(gen_json) == list(expected_events(mock.value))
+    assert gen_json.value == mock.value
+    assert gen_json.event_handler is None
+
+
+def test_parallel_subtrees_interleave_their_events():
+    mock = MockAnthropicClient.from_schema(SCHEMA, seed=2)
+    received = collect(JsonformerClaude(mock, SCHEMA, "p", parallel=True))
+    expected = list(expected_events(mock.value))
+    assert sorted(map(repr, received)) == sorted(map(repr, expected))
+    assert received[0] == expected[0] and received[-1] == expected[-1]
+    # Each subtree's own events are still in order
+    for key in mock.value:
+        assert subtree(received, "/" + key) == subtree(expected, "/" + key)
+
+
+def test_a_cached_value_replays_its_events():
+    cache = ResponseCache()
+    mock = MockAnthropicClient.from_schema(SCHEMA, seed=2)
+    collect(JsonformerClaude(mock, SCHEMA, "p", cache=cache))
+    gen_json = JsonformerClaude(mock, SCHEMA, "p", cache=cache)
+    assert collect(gen_json) == list(expected_events(mock.value))
+    assert mock.request_count == 1
+
+
+def test_stopping_early_cancels_the_generation():
+    mock = MockAnthropicClient.from_schema(SCHEMA, seed=2, array_length=20, chunk_latency=0.02)
+    gen_json = JsonformerClaude(mock, SCHEMA, "p")
+
+    async def main():
+        stream = gen_json.stream_events()
+        first = await stream.__anext__()
+        await stream.aclose()
+        streamed = mock.streamed_bytes
+        await asyncio.sleep(0.1)
+        return first, streamed
+
+    started = time.perf_counter()
+    first, streamed = asyncio.run(main())
+    assert first == FieldEvent(events.START_OBJECT, "")
+    assert time.perf_counter() - started < 0.5
+    # Nothing more was read once the consumer stopped
+    assert mock.streamed_bytes == streamed < len(mock.document)
+    assert gen_json.event_handler is None
+
+
+def test_a_failure_is_raised_after_the_events_before_it():
+    class Dropping(MockAnthropicClient):
+        async def _stream(self, completion):
+            async for chunk in super()._stream(completion):
+                if len(chunk["completion"]) > len(completion) // 2:
+                    raise ConnectionError("connection dropped")
+                yield chunk
+
+    mock = Dropping.from_schema(SCHEMA, seed=2)
+    gen_json = JsonformerClaude(mock, SCHEMA, "p")
+    received = []
+
+    async def main():
+        async for event in gen_json.stream_events():
+            received.append(event)
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(main())
+    assert 2 <= len(received) < len(list(expected_events(mock.value)))
+    assert received == list(expected_events(mock.value))[: len(received)]
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from jsonformer_claude.fields.bool import BoolField
+from jsonformer_claude.fields.integer import IntField
+from jsonformer_claude.fields.string import StrField
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+
+
+def feed(field, text, chunk_size):
+    parser = field.parser()
+    for start in range(0, len(text), chunk_size):
+        result = parser.feed(text[start : start + chunk_size])
+        if result.value_found:
+            return result
+    return parser.feed("")
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 100])
+@pytest.mark.parametrize(
+    "field, text, value",
+    [
+        (StrField({"type": "string"}), '"plain"', "plain"),
+        (StrField({"type": "string"}), r'"say \"hi\" \\"', 'say "hi" \\'),
+        (StrField({"type": "string"}), '"h\\u00e9"', "hé"),
+        (IntField({"type": "number"}), "-12.5,", -12.5),
+        (IntField({"type": "number"}), "3e2}", 300.0),
+        (BoolField({"type": "boolean"}), "false", False),
+        (StrField({"type": "string", "enum": ["red", "blue"]}), '"blue"', "blue"),
+    ],
+)
+def test_valid_tokens_whatever_the_chunking(field, text, value, chunk_size):
+    result = feed(field, text, chunk_size)
+    assert result.value_valid
+    assert result.value == value
+    assert text.startswith(result.text)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+@pytest.mark.parametrize(
+    "field, text",
+    [
+        (StrField({"type": "string", "enum": ["red", "blue"]}), '"green"'),
+        (StrField({"type": "string", "maxLength": 3}), '"four"'),
+        (StrField({"type": "string", "format": "date"}), '"2020-1-01"'),
+        (IntField({"type": "number", "max": 10}), "11,"),
+        (IntField({"type": "number", "min": -10}), "-11,"),
+        (IntField({"type": "number"}), "01,"),
+        (BoolField({"type": "boolean"}), "maybe"),
+        (StrField({"type": "string"}), "null"),
+    ],
+)
+def test_invalid_tokens_are_rejected(field, text, chunk_size):
+    result = feed(field, text, chunk_size)
+    assert result.value_found and not result.value_valid
+
+
+def test_prefix_checks_reject_before_the_token_ends():
+    parser = StrField({"type": "string", "enum": ["red", "blue"]}).parser()
+    assert parser.feed('"gr').value_found
+    parser = IntField({"type": "number", "max": 10}).parser()
+    assert parser.feed("11").value_found
+
+
+NULLABLE_STRINGS = [
+    {"type": "string", "nullable": True, "enum": ["x", "y"]},
+    {"type": "string", "nullable": True, "format": "date"},
+    {"type": "string", "nullable": True, "format": "date-time"},
+    {"type": "string", "nullable": True, "maxLength": 2},
+    {"type": "string", "nullable": True, "pattern": "^[0-9]+$"},
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3])
+@pytest.mark.parametrize(
+    "field",
+    [StrField(schema) for schema in NULLABLE_STRINGS]
+    + [IntField({"type": "number", "nullable": True, "min": 5, "max": 10})],
+)
+def test_null_passes_the_prefix_checks_of_nullable_fields(field, chunk_size):
+    # A chunk boundary inside the literal used to run the string checks on it
+    result = feed(field, "null", chunk_size)
+    assert result.value_valid
+    assert result.value is None
+
+
+def test_split_null_of_a_nullable_enum_takes_one_request():
+    schema = {
+        "type": "object",
+        "properties": {"a": {"type": "string", "nullable": True, "enum": ["x", "y"]}},
+    }
+    mock = MockAnthropicClient(script=["null}"], chunk_size=2)
+    gen_json = JsonformerClaude(mock, schema, "p")
+    assert asyncio.run(gen_json()) == {"a": None}
+    assert gen_json.llm_request_count == 1
@@ -0,0 +1,80 @@
+import pytest
+
+from jsonformer_claude.mock import MockAnthropicClient
+from jsonformer_claude.schema import compile_schema
+
+SPARSE = {
+    "type": "object",
+    "required": ["id"],
+    "properties": {
+        "id": {"type": "string"},
+        "name": {"type": "string"},
+        "age": {"type": ["number", "null"]},
+        "tags": {"type": "array", "items": {"type": "string"}, "nullable": True},
+        "address": {
+            "anyOf": [
+                {
+                    "type": "object",
+                    "required": ["city"],
+                    "properties": {"street": {"type": "string"}, "city": {"type": "string"}},
+                },
+                {"type": "null"},
+            ]
+        },
+    },
+}
+
+
+def test_required_marks_the_other_properties_optional():
+    plan = compile_schema(SPARSE)
+    assert [prop.required for prop in plan.root.properties] == [True, False, False, False, False]
+
+
+def test_without_required_every_property_is_required():
+    plan = compile_schema({"type": "object", "properties": {"a": {"type": "string"}}})
+    assert plan.root.properties[0].required
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_sparse_documents_are_followed(generate, seed):
+    mock = MockAnthropicClient.from_schema(SPARSE, seed=seed, mistake_rate=0.3)
+    value, gen_json = generate(SPARSE, mock)
+    assert value == mock.value
+    assert list(value) == list(mock.value)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_speculation_falls_back_with_a_required_first_property(generate, seed):
+    # The first key used to be written before speculating even though the
+    # field-by-field fallback doesn't write it, so the fallback read the
+    # response before its start
+    mock = MockAnthropicClient.from_schema(SPARSE, seed=seed, mistake_rate=0.3)
+    value, _ = generate(SPARSE, mock, speculative=True)
+    assert value == mock.value
+
+
+def test_required_property_left_out_is_written_anyway(generate):
+    schema = {
+        "type": "object",
+        "required": ["b"],
+        "properties": {"a": {"type": "string"}, "b": {"type": "string"}},
+    }
+    completions = ['"a":"x"}', '"y"}']
+    mock = MockAnthropicClient(script=lambda prompt: completions.pop(0))
+    value, gen_json = generate(schema, mock)
+    assert value == {"a": "x", "b": "y"}
+    assert gen_json.llm_request_count == 2
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+def test_optional_properties_keep_the_written_order(generate, speculative):
+    schema = {
+        "type": "object",
+        "required": [],
+        "properties": {"b": {"type": "number"}, "c": {"type": "boolean"}},
+    }
+    mock = MockAnthropicClient(script=['"c":true,"b":3}'])
+    value, gen_json = generate(schema, mock, speculative=speculative)
+    assert list(value) == ["c", "b"]
+    assert gen_json.get_progress() == '{"c":true,"b":3}'
+    assert gen_json.llm_request_count == 1
@@ -0,0 +1,117 @@
+import asyncio
+import time
+
+import pytest
+
+from jsonformer_claude.backends import LocalBackend
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+
+WIDE = {
+    "type": "object",
+    "properties": {
+        "id": {"type": "string"},
+        "car": {
+            "type": "object",
+            "properties": {"make": {"type": "string"}, "year": {"type": "number"}},
+        },
+        "owner": {"type": "object", "properties": {"name": {"type": "string"}}},
+        "tags": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+ITEMS = {
+    "type": "object",
+    "properties": {
+        "people": {
+            "type": "array",
+            "minItems": 3,
+            "maxItems": 3,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "tags": {"type": "array", "items": {"type": "string"}},
+                },
+            },
+        }
+    },
+}
+
+
+def spans(gen_json):
+    return sorted(gen_json.progress.arrays, key=lambda span: span.start)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_siblings_are_merged_in_schema_order(generate, seed):
+    mock = MockAnthropicClient.from_schema(WIDE, seed=seed)
+    value, gen_json = generate(WIDE, mock, parallel=True)
+    assert value == mock.value
+    assert list(value) == ["id", "car", "owner", "tags"]
+    assert gen_json.get_progress() == mock.document
+    # "id" and "car" here, "owner" and "tags" on a fork each
+    assert gen_json.llm_request_count == mock.request_count == 3
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_fork_counters_are_absorbed(generate, seed):
+    mock = MockAnthropicClient.from_schema(WIDE, seed=seed, mistake_rate=0.5)
+    value, gen_json = generate(WIDE, mock, parallel=True)
+    assert value == mock.value
+    # Re-requests made by the forks included
+    assert gen_json.llm_request_count == mock.request_count
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_items_are_generated_concurrently(generate, seed):
+    mock = MockAnthropicClient.from_schema(ITEMS, seed=seed)
+    value, gen_json = generate(ITEMS, mock, parallel=True)
+    sequential_mock = MockAnthropicClient.from_schema(ITEMS, seed=seed)
+    sequential_value, sequential = generate(ITEMS, sequential_mock)
+    assert value == sequential_value
+    assert gen_json.llm_request_count == 3
+    assert gen_json.get_progress() == sequential.get_progress()
+    # The arrays the forks wrote are tracked at their offsets in the merged text
+    assert spans(gen_json) == spans(sequential)
+
+
+class Stalled(LocalBackend):
+    """Stalls every stream for a second; completions `fails` accepts raise instead."""
+
+    def __init__(self, fails):
+        super().__init__(self.complete_or_fail)
+        self.fails = fails
+        self.opened = 0
+        self.closed = 0
+
+    def complete_or_fail(self, prompt):
+        if self.fails(prompt):
+            raise RuntimeError("failed")
+        return '"x","tags":[]}'
+
+    async def _stream(self, completion):
+        self.opened += 1
+        try:
+            await asyncio.sleep(1)
+            yield completion
+        finally:
+            self.closed += 1
+
+
+@pytest.mark.parametrize(
+    "fails",
+    [
+        lambda prompt: "item 2 of" in prompt,
+        # The first item, which the forking engine generates itself
+        lambda prompt: "Only output item" not in prompt,
+    ],
+)
+def test_a_failure_cancels_the_other_forks(fails):
+    backend = Stalled(fails)
+    gen_json = JsonformerClaude(backend, ITEMS, "p", parallel=True)
+    started = time.perf_counter()
+    with pytest.raises(RuntimeError):
+        asyncio.run(gen_json())
+    assert time.perf_counter() - started < 0.5
+    assert backend.opened == backend.closed == 2
@@ -0,0 +1,51 @@
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+from jsonformer_claude.progress import ProgressBuffer
+from jsonformer_claude.stream import StreamBuffer
+
+
+def stream(text, start):
+    buffer = StreamBuffer(start=start)
+    buffer.feed(text)
+    return buffer
+
+
+def progress_of(*parts):
+    progress = ProgressBuffer()
+    for part in parts:
+        progress.append(part)
+    return progress
+
+
+def test_progress_matches_the_response_from_start():
+    progress = progress_of("{", '"a":', "1", ",")
+    response = stream('"a":1,"b"', 1)
+    # Verified from where the response was requested
+    assert progress.matches(response, 1)
+    assert progress.matches(response, 3)
+    assert not progress.matches(stream('"a":2,', 1), 1)
+    # A shorter response can't be checked yet
+    assert not progress.matches(stream('"a"', 1), 1)
+
+
+def test_progress_only_compares_text_past_start():
+    progress = progress_of("{", '"a":', "1", ",")
+    response = stream('"a":9,', 1)
+    assert not progress.matches(response, 1)
+    assert progress.matches(response, 6)
+
+
+def test_progress_never_matches_from_past_its_end():
+    progress = progress_of("{")
+    response = stream('"a":1', 7)
+    assert not progress.matches(response, 7)
+
+
+def test_engines_have_their_own_progress():
+    schema = {"type": "object", "properties": {"a": {"type": "number"}}}
+    mock = MockAnthropicClient.from_schema(schema)
+    first = JsonformerClaude(mock, schema, "p")
+    first.progress.append('{"a":5')
+    second = JsonformerClaude(mock, schema, "p")
+    assert second.get_progress() == ""
+    assert second.value == {} and second.value is not first.value
@@ -0,0 +1,78 @@
+import pytest
+
+from jsonformer_claude.mock import MockAnthropicClient
+from jsonformer_claude.schema import compile_schema
+
+TREE = {
+    "type": "object",
+    "$defs": {
+        "node": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "children": {"type": "array", "items": {"$ref": "#/$defs/node"}},
+            },
+        },
+        "user": {"type": "object", "properties": {"id": {"type": "number"}}},
+    },
+    "properties": {
+        "root": {"$ref": "#/$defs/node"},
+        "owner": {"$ref": "#/$defs/user"},
+    },
+}
+
+
+def depth(node):
+    return 1 + max((depth(child) for child in node["children"]), default=0)
+
+
+def tree_mock():
+    return MockAnthropicClient.from_schema(TREE, array_length=2, max_depth=8)
+
+
+@pytest.mark.parametrize("max_ref_depth", [0, 1, 2])
+def test_refs_nest_at_most_max_ref_depth_times(generate, max_ref_depth):
+    value, _ = generate(TREE, tree_mock(), max_ref_depth=max_ref_depth)
+    # The outermost node isn't nested in itself
+    assert depth(value["root"]) == max_ref_depth + 1
+    assert value["owner"] is not None
+
+
+@pytest.mark.parametrize("max_ref_depth", [0, 1, 2])
+def test_speculation_keeps_to_max_ref_depth(generate, max_ref_depth):
+    value, _ = generate(TREE, tree_mock(), max_ref_depth=max_ref_depth, speculative=True)
+    assert depth(value["root"]) == max_ref_depth + 1
+    assert value == generate(TREE, tree_mock(), max_ref_depth=max_ref_depth)[0]
+
+
+def test_no_limit_follows_the_document(generate):
+    mock = tree_mock()
+    value, _ = generate(TREE, mock, max_ref_depth=None)
+    assert value == mock.value
+
+
+@pytest.mark.parametrize(
+    "ref", ["#/$defs/a~1b", "#/definitions/x%20y", "#/properties/flag"]
+)
+def test_refs_resolve_escaped_pointers(ref):
+    schema = {
+        "type": "object",
+        "$defs": {"a/b": {"type": "boolean"}},
+        "definitions": {"x y": {"type": "boolean"}},
+        "properties": {"flag": {"type": "boolean"}, "x": {"$ref": ref}},
+    }
+    assert ref in compile_schema(schema).definitions
+
+
+@pytest.mark.parametrize(
+    "defs",
+    [
+        {"a": {"$ref": "#/$defs/a"}},
+        {"a": {"$ref": "#/$defs/b"}, "b": {"$ref": "#/$defs/a"}},
+        {},
+    ],
+)
+def test_unresolvable_refs_are_rejected(defs):
+    schema = {"type": "object", "$defs": defs, "properties": {"x": {"$ref": "#/$defs/a"}}}
+    with pytest.raises(ValueError):
+        compile_schema(schema)
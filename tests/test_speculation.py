@@ -0,0 +1,84 @@
+import pytest
+
+from jsonformer_claude.mock import MockAnthropicClient
+
+SCHEMA = {
+    "type": "object",
+    "required": ["id", "items"],
+    "properties": {
+        "id": {"type": "string"},
+        "note": {"type": ["string", "null"]},
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"n": {"type": "number"}, "ok": {"type": "boolean"}},
+            },
+        },
+    },
+}
+
+ENUM = {
+    "type": "object",
+    "properties": {
+        "a": {"type": "string", "enum": ["x", "y"]},
+        "b": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+TAIL = ',"b":[' + ",".join(['"filler"'] * 200) + "]}"
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_a_valid_first_completion_is_accepted_in_one_request(generate, seed):
+    mock = MockAnthropicClient.from_schema(SCHEMA, seed=seed)
+    value, gen_json = generate(SCHEMA, mock, speculative=True)
+    assert value == mock.value
+    assert list(value) == list(mock.value)
+    assert gen_json.get_progress() == mock.document
+    assert gen_json.llm_request_count == 1
+
+
+def scripted():
+    completions = ['"z"' + TAIL, '"x"' + TAIL]
+    return MockAnthropicClient(script=lambda prompt: completions.pop(0))
+
+
+@pytest.mark.parametrize("speculative", [False, True])
+def test_an_invalid_token_stops_the_stream_there(generate, speculative):
+    mock = scripted()
+    value, gen_json = generate(ENUM, mock, speculative=speculative)
+    assert value == {"a": "x", "b": ["filler"] * 200}
+    assert gen_json.llm_request_count == 2
+    # The first stream is dropped at its first chunk, not read to its end
+    assert mock.streamed_bytes <= len('"x"' + TAIL) + 2 * mock.chunk_size
+
+
+def test_speculation_streams_no_more_than_field_generation(generate):
+    field_mock = MockAnthropicClient.from_schema(SCHEMA, seed=1, mistake_rate=0.5)
+    generate(SCHEMA, field_mock)
+    speculative_mock = MockAnthropicClient.from_schema(SCHEMA, seed=1, mistake_rate=0.5)
+    value, _ = generate(SCHEMA, speculative_mock, speculative=True)
+    assert value == speculative_mock.value
+    assert speculative_mock.streamed_bytes <= field_mock.streamed_bytes
+
+
+NUMBERS = {
+    "type": "object",
+    "properties": {"a": {"type": "number"}, "b": {"type": "number"}},
+}
+
+
+@pytest.mark.parametrize(
+    "script, requests",
+    [
+        # Claude's value is replaced, and the rest re-requested after it
+        (['1,"b":2}', "2}"], 2),
+        (['99,"b":2}'], 1),
+    ],
+)
+def test_speculation_keeps_the_defaults(generate, script, requests):
+    mock = MockAnthropicClient(script=script)
+    value, gen_json = generate(NUMBERS, mock, speculative=True, defaults={"/a": 99})
+    assert value == {"a": 99, "b": 2}
+    assert gen_json.llm_request_count == requests
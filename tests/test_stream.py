@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from jsonformer_claude.stream import StreamBuffer
+
+PRETTY = '{\n  "a b": "x  y",\n  "c": [1, 2],\n  "d": "q\\" }"\n}'
+
+
+def stream(text, chunk_size, start=0):
+    buffer = StreamBuffer(start=start)
+    for index in range(0, len(text), chunk_size):
+        buffer.feed(text[index : index + chunk_size])
+    return buffer
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 5, 100])
+def test_stream_buffer_drops_whitespace_outside_strings(chunk_size):
+    buffer = stream(PRETTY, chunk_size)
+    assert str(buffer) == json.dumps(json.loads(PRETTY), separators=(",", ":"))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 100])
+def test_stream_buffer_positions_follow_the_progress(chunk_size):
+    buffer = stream('"x":1}', chunk_size, start=4)
+    assert len(buffer) == 10
+    assert buffer[4] == '"'
+    assert buffer.slice(4) == '"x":1}'
+    assert buffer.slice(0, 6) == '"x'
+    assert buffer.startswith(":1", 7)
+    with pytest.raises(IndexError):
+        buffer[3]
+    with pytest.raises(IndexError):
+        buffer[10]
+
+
+def test_stream_buffer_keeps_escaped_quotes_in_strings():
+    buffer = stream('"a \\\\" , "b \\" c"', 3)
+    assert str(buffer) == '"a \\\\","b \\" c"'
@@ -0,0 +1,106 @@
+import asyncio
+import concurrent.futures
+import time
+
+import pytest
+
+from jsonformer_claude.backends import LocalBackend
+from jsonformer_claude.sync import SyncJsonformerClaude
+
+SCHEMA = {"type": "object", "properties": {"a": {"type": "string"}}}
+
+
+class Recording(LocalBackend):
+    """Answers with the prompt's last word, stalling prompts ending in "stall"."""
+
+    def __init__(self):
+        super().__init__(self.answer)
+        self.loops = set()
+        self.opened = 0
+        self.closed = 0
+        self.backend_closed = False
+
+    def answer(self, prompt):
+        self.loops.add(asyncio.get_running_loop())
+        word = prompt.split("Human:")[1].split()[0]
+        return f'"{word}"}}'
+
+    async def _stream(self, completion):
+        self.opened += 1
+        try:
+            if completion == '"stall"}':
+                await asyncio.sleep(10)
+            async for chunk in super()._stream(completion):
+                yield chunk
+        finally:
+            self.closed += 1
+
+    async def close(self):
+        self.backend_closed = True
+
+
+def wait_until(condition, timeout=1.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_threads_share_one_loop():
+    backend = Recording()
+    prompts = [f"word{index} please" for index in range(16)]
+    with SyncJsonformerClaude(backend, SCHEMA) as sync:
+        with concurrent.futures.ThreadPoolExecutor(8) as pool:
+            values = list(pool.map(sync.generate, prompts))
+    assert values == [{"a": f"word{index}"} for index in range(16)]
+    assert backend.loops == {sync.loop}
+
+
+def test_submit_returns_a_future():
+    with SyncJsonformerClaude(Recording(), SCHEMA) as sync:
+        futures = [sync.submit(f"w{index}") for index in range(3)]
+        values = [future.result(1) for future in futures]
+    assert values == [{"a": "w0"}, {"a": "w1"}, {"a": "w2"}]
+
+
+def test_engine_args_can_be_overridden_per_call():
+    with SyncJsonformerClaude(Recording(), SCHEMA, defaults={"/a": "fixed"}) as sync:
+        assert sync.generate("x") == {"a": "fixed"}
+        assert sync.generate("x", defaults={}) == {"a": "x"}
+
+
+def test_a_timeout_cancels_the_generation():
+    backend = Recording()
+    with SyncJsonformerClaude(backend, SCHEMA) as sync:
+        with pytest.raises(concurrent.futures.TimeoutError):
+            sync.generate("stall", timeout=0.1)
+        # The stalled stream is closed rather than left running on the loop
+        assert wait_until(lambda: backend.closed == backend.opened == 1)
+        assert sync.generate("after") == {"a": "after"}
+
+
+def test_close_cancels_running_generations_and_stops_the_loop():
+    backend = Recording()
+    sync = SyncJsonformerClaude(backend, SCHEMA)
+    future = sync.submit("stall")
+    assert wait_until(lambda: backend.opened == 1)
+    sync.close()
+    assert future.cancelled()
+    assert backend.closed == 1
+    assert backend.backend_closed
+    assert not sync.thread.is_alive()
+    with pytest.raises(RuntimeError):
+        sync.submit("x")
+    # Closing again is harmless
+    sync.close()
+
+
+def test_generate_refuses_to_block_its_own_loop():
+    with SyncJsonformerClaude(Recording(), SCHEMA) as sync:
+
+        async def nested():
+            return sync.generate("x")
+
+        future = asyncio.run_coroutine_threadsafe(nested(), sync.loop)
+        with pytest.raises(RuntimeError):
+            future.result(1)
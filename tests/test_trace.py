@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+from jsonformer_claude.trace import GENERATION, REQUEST, RESULT, Trace, main, replay
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "age": {"type": "number"},
+        "pets": {"type": "array", "items": {"type": "string"}},
+    },
+}
+
+
+def record(trace, seeds, **engine_args):
+    values = []
+    for seed in seeds:
+        mock = MockAnthropicClient.from_schema(SCHEMA, seed=seed, mistake_rate=0.5)
+        gen_json = JsonformerClaude(mock, SCHEMA, "p", trace=trace, **engine_args)
+        values.append(asyncio.run(gen_json()))
+    return values
+
+
+def test_recorded_generations_replay_to_the_same_values():
+    trace = Trace()
+    record(trace, range(4))
+    kinds = [event[2] for event in trace.events]
+    assert kinds.count(GENERATION) == kinds.count(RESULT) == 4
+
+    results = asyncio.run(replay(trace))
+    assert [result.generation for result in results] == sorted(
+        {event[1] for event in trace.events}
+    )
+    assert all(result.matches and result.error is None for result in results)
+    assert [result.requests for result in results] == [
+        result.recorded_requests for result in results
+    ]
+    # Some of the seeds made mistakes that were re-requested
+    assert kinds.count(REQUEST) > 4
+
+
+def test_a_trace_file_replays_from_the_command_line(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    record(Trace(path), range(2), speculative=True)
+    assert len(Trace.load(path)) > 0
+    assert main([path]) == 0
+    results = asyncio.run(replay(path))
+    assert len(results) == 2 and all(result.matches for result in results)
+
+
+@pytest.mark.parametrize("schema_format", ["minified", "typescript"])
+def test_replay_under_another_schema_format(schema_format):
+    trace = Trace()
+    record(trace, range(3))
+    results = asyncio.run(replay(trace, schema_format=schema_format))
+    # The prompts differ, so completions are found by the text they continue
+    assert all(result.matches for result in results)
+
+
+def test_a_generation_whose_start_fell_out_of_the_ring_buffer_is_skipped():
+    trace = Trace(capacity=5)
+    record(trace, [0])
+    assert asyncio.run(replay(trace)) == []
@@ -0,0 +1,108 @@
+import pytest
+
+from jsonformer_claude.main import JsonformerClaude
+from jsonformer_claude.mock import MockAnthropicClient
+from jsonformer_claude.progress import ProgressBuffer
+
+SCHEMA = {
+    "type": "object",
+    "properties": {"a": {"type": "array", "items": {"type": "number"}}},
+}
+
+LONG = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "characters": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "quotes": {"type": "array", "items": {"type": "string"}},
+                },
+            },
+        },
+    },
+}
+
+
+def array_progress(items, closed=True):
+    progress = ProgressBuffer('{"a":')
+    span = progress.open_array("/a")
+    for index, item in enumerate(items):
+        if index:
+            progress.append(",")
+        span.items.append(len(progress))
+        progress.append(item)
+    if closed:
+        progress.close_array(span)
+        progress.append("}")
+    return progress
+
+
+def test_windowed_keeps_the_last_finished_items():
+    progress = array_progress(["1", "2", "3", "4"])
+    assert progress.windowed(2) == ('{"a":[3,4]}', [("/a", 2)])
+    assert progress.windowed(0) == ('{"a":[]}', [("/a", 4)])
+    assert progress.windowed(4) == (progress.getvalue(), [])
+
+
+def test_windowed_keeps_the_item_being_written():
+    progress = array_progress(["1", "2", "3", '"x'], closed=False)
+    assert progress.windowed(1) == ('{"a":[3,"x', [("/a", 2)])
+    assert progress.windowed(0) == ('{"a":["x', [("/a", 3)])
+
+
+def test_windowed_nested_arrays_inside_left_out_items():
+    progress = ProgressBuffer('{"a":')
+    outer = progress.open_array("/a")
+    for index in range(3):
+        if index:
+            progress.append(",")
+        outer.items.append(len(progress))
+        inner = progress.open_array(f"/a/{index}")
+        inner.items.append(len(progress))
+        progress.append(str(index))
+        progress.close_array(inner)
+    progress.close_array(outer)
+    progress.append("}")
+    assert progress.windowed(1) == ('{"a":[[2]]}', [("/a", 2)])
+
+
+def test_windowed_leaves_out_nothing_in_a_short_array():
+    progress = array_progress(["1"], closed=False)
+    assert progress.windowed(2) == ('{"a":[1', [])
+
+
+@pytest.mark.parametrize("window, left_out, kept", [(0, 2, "3"), (1, 1, "2,3")])
+def test_get_prompt_says_how_many_items_are_left_out(window, left_out, kept):
+    gen_json = JsonformerClaude(MockAnthropicClient(), SCHEMA, "p", array_window=window)
+    # The item being written is always kept
+    gen_json.progress = array_progress(["1", "2", "3"], closed=False)
+    prompt = gen_json.get_prompt()
+    assert f"The first {left_out} items of /a are left out of the output below." in prompt
+    assert prompt.endswith('{"a":[' + kept)
+
+
+def test_get_prompt_without_a_window_sends_everything():
+    gen_json = JsonformerClaude(MockAnthropicClient(), SCHEMA, "p")
+    gen_json.progress = array_progress(["1", "2", "3"], closed=False)
+    assert gen_json.get_prompt() == gen_json.prompt_prefix + '{"a":[1,2,3'
+
+
+# Seeds whose documents have a mistake that is re-requested
+@pytest.mark.parametrize("seed", [3, 4])
+def test_windowed_re_requests_still_build_the_whole_value(generate, seed):
+    def long_mock():
+        return MockAnthropicClient.from_schema(
+            LONG, seed=seed, array_length=20, mistake_rate=0.3
+        )
+
+    windowed_mock = long_mock()
+    value, _ = generate(LONG, windowed_mock, array_window=2)
+    full_mock = long_mock()
+    generate(LONG, full_mock)
+    assert value == windowed_mock.value
+    assert windowed_mock.request_count == full_mock.request_count > 1
+    assert windowed_mock.prompt_bytes < full_mock.prompt_bytes